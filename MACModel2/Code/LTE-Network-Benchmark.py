@@ -0,0 +1,269 @@
+#============== Load Generator for the LTE Sub Network Model ==============
+
+#   Drives the network endpoints with open-loop request arrivals and reports
+#   the latency percentiles and achieved throughput of every stage.
+#
+#   python LTE-Network-Benchmark.py --url http://localhost:5000 --duration 30
+#   python LTE-Network-Benchmark.py --in-process --rate Modulation=500 --baseline results.json
+
+#====================================================================
+
+
+#-------------- Importing required Python libraries --------------
+
+import asyncio
+import argparse
+import importlib.util
+import subprocess
+import datetime
+import json
+import csv
+import math
+import os
+import re
+import sys
+from random import Random
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+#-------------- Benchmark Parameters --------------
+
+# endpoint paths and default arrival rates (requests per second), after LTE-Network-Controller.js
+endpoints = {
+    "UERegistration" : ["/SubNetworkLTE/AirInterface/UERegistration/10", 1],
+    "Modulation" : ["/SubNetworkLTE/PhysicalUplinkControlChannel/Modulation", 100],
+    "Profiler" : ["/SubNetworkLTE/MAC/Profiler", 100],
+    "Sorter" : ["/SubNetworkLTE/Scheduler/Sorter", 100],
+    "Schedule" : ["/SubNetworkLTE/Scheduler/Schedule", 100]
+}
+model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LTE-Network-Model.py")
+max_in_flight = 1000 # requests in flight per endpoint before new arrivals are shed
+percentiles = [50, 95, 99]
+body_code = re.compile(rb"\s*(\d{3}):")
+
+#-------------- Transports --------------
+
+def response_code(status, body):
+    # the model answers most failures with HTTP 200 and a "<code>: <message>" body, so the body's code wins
+    match = body_code.match(body)
+    return int(match.group(1)) if match else status
+
+class HTTPTarget:
+    '''
+        A running instance of the model, called over plain HTTP/1.1 with asyncio streams
+    '''
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+
+    def describe(self):
+        return "http://%s:%s%s" % (self.host, self.port, self.prefix)
+
+    async def get(self, path, ip_address):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(("GET %s%s HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n" % (self.prefix, path, self.host)).encode("ascii"))
+            await writer.drain()
+            status_line = await reader.readline()
+            response = await reader.read()  # headers and body, until the server closes
+            return response_code(int(status_line.split()[1]), response.partition(b"\r\n\r\n")[2])
+        finally:
+            writer.close()
+
+    def close(self):
+        pass
+
+class InProcessTarget:
+    '''
+        The model loaded into this process and called through the Flask test client on a
+        thread pool, with each request coming from the UE address the driver gives it
+    '''
+    def __init__(self, workers=32):
+        spec = importlib.util.spec_from_file_location("lte_network_model", model_path)
+        self.model = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.model)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def describe(self):
+        return "in-process:%s" % model_path
+
+    def call(self, path, ip_address):
+        response = self.model.app.test_client().get(path, environ_base={ "REMOTE_ADDR" : ip_address })
+        return response_code(response.status_code, response.get_data())
+
+    async def get(self, path, ip_address):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.call, path, ip_address)
+
+    def close(self):
+        self.executor.shutdown()
+
+#-------------- Open-loop Driver --------------
+
+async def timed_request(target, path, ip_address, due, samples):
+    # latency is measured from the scheduled arrival, so a slow server cannot hide its queueing delay
+    loop = asyncio.get_running_loop()
+    try:
+        status = await target.get(path, ip_address)
+    except Exception as e:
+        status = "error: %s" % e.__class__.__name__
+    if succeeded(status):
+        # only answered requests count towards throughput and latency
+        samples["latencies"].append(loop.time() - due)
+    samples["codes"][str(status)] = samples["codes"].get(str(status), 0) + 1
+    samples["finished"] = loop.time()
+
+async def drive_endpoint(target, name, path, rate, duration, arrival, n_UEs, rng):
+    # fires requests at the arrival rate for duration seconds whether or not earlier ones have returned
+    loop = asyncio.get_running_loop()
+    samples = { "sent" : 0, "shed" : 0, "latencies" : [], "codes" : {}, "started" : loop.time(), "finished" : None }
+    if rate <= 0:
+        return samples
+    due = samples["started"]; in_flight = set()
+    while True:
+        due += rng.expovariate(rate) if arrival == "poisson" else 1.0/rate
+        if due - samples["started"] >= duration:
+            break
+        await asyncio.sleep(max(due - loop.time(), 0))
+        if len(in_flight) >= max_in_flight:
+            samples["shed"] += 1
+            continue
+        ip_address = "10.0.%s.%s" % (samples["sent"] % n_UEs // 250, samples["sent"] % n_UEs % 250 + 1)
+        task = asyncio.ensure_future(timed_request(target, path, ip_address, due, samples))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        samples["sent"] += 1
+    if in_flight:
+        await asyncio.wait(in_flight)
+    return samples
+
+def succeeded(status):
+    return isinstance(status, int) and 200 <= status < 300
+
+def percentile(ordered, p):
+    # nearest-rank percentile of a sorted list
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(math.ceil(p/100.0*len(ordered)) - 1, 0))]
+
+def summarize(name, path, rate, duration, samples):
+    ordered = sorted(samples["latencies"])
+    completed = len(ordered)
+    # throughput over the load window, or until the last response if the server lagged behind it
+    elapsed = max(samples["finished"] - samples["started"], duration) if samples["finished"] else 0
+    errors = sum([n for code, n in samples["codes"].items() if not (code.isdigit() and succeeded(int(code)))])
+    row = {
+        "endpoint" : name,
+        "path" : path,
+        "target_rps" : rate,
+        "sent" : samples["sent"],
+        "shed" : samples["shed"],
+        "completed" : completed,
+        "errors" : errors,
+        "achieved_rps" : round(completed/elapsed, 3) if elapsed else 0,
+        "mean_ms" : round(1000*sum(ordered)/completed, 3) if completed else None,
+        "max_ms" : round(1000*ordered[-1], 3) if completed else None
+    }
+    for p in percentiles:
+        value = percentile(ordered, p)
+        row["p%s_ms" % p] = round(1000*value, 3) if value is not None else None
+    row["codes"] = samples["codes"]
+    return row
+
+async def run_benchmark(target, rates, duration, arrival, n_UEs, seed):
+    drives = [drive_endpoint(target, name, endpoints[name][0], rates[name], duration, arrival, n_UEs, Random("%s-%s" % (seed, name))) for name in rates]
+    results = await asyncio.gather(*drives)
+    return [summarize(name, endpoints[name][0], rates[name], duration, samples) for name, samples in zip(rates, results)]
+
+#-------------- Results --------------
+
+def model_version():
+    # git revision of the model, so results can be compared across versions
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(model_path), stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def write_results(report, path):
+    # <path>.json holds the whole report, <path>.csv one row per endpoint
+    with open(path + ".json", "w") as handle:
+        json.dump(report, handle, indent=4)
+    rows = [dict(row, codes=json.dumps(row["codes"])) for row in report["results"]]
+    with open(path + ".csv", "w", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def regressions(report, baseline, tolerance):
+    # endpoints whose p95 latency rose, or whose achieved throughput fell, by more than the tolerance
+    # (only endpoints driven at the same arrival rate in both runs are compared)
+    previous = { row["endpoint"] : row for row in baseline["results"] }
+    found = []
+    for row in report["results"]:
+        before = previous.get(row["endpoint"])
+        if not before or before["target_rps"] != row["target_rps"]:
+            continue
+        if before["p95_ms"] and row["p95_ms"] and row["p95_ms"] > before["p95_ms"]*(1 + tolerance):
+            found.append("%s: p95 %sms -> %sms" % (row["endpoint"], before["p95_ms"], row["p95_ms"]))
+        if before["achieved_rps"] and row["achieved_rps"] < before["achieved_rps"]*(1 - tolerance):
+            found.append("%s: throughput %s/s -> %s/s" % (row["endpoint"], before["achieved_rps"], row["achieved_rps"]))
+    return found
+
+def print_table(report):
+    columns = ["endpoint", "target_rps", "achieved_rps", "completed", "errors", "shed"] + ["p%s_ms" % p for p in percentiles]
+    print(" ".join(["%-15s" % column for column in columns]))
+    for row in report["results"]:
+        print(" ".join(["%-15s" % row[column] for column in columns]))
+
+#-------------- Command Line --------------
+
+def parse_rates(overrides):
+    rates = { name : endpoints[name][1] for name in endpoints }
+    for override in overrides or []:
+        name, rate = override.split("=")
+        if name not in endpoints:
+            raise SystemExit("Unknown endpoint: %s (one of %s)" % (name, ", ".join(endpoints)))
+        rates[name] = float(rate)
+    return rates
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop load generator for the LTE network model")
+    parser.add_argument("--url", default="http://localhost:5000", help="running model to benchmark")
+    parser.add_argument("--in-process", action="store_true", help="load the model into this process instead of calling --url")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load per endpoint")
+    parser.add_argument("--rate", action="append", metavar="ENDPOINT=RPS", help="arrival rate of an endpoint (0 disables it)")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="poisson")
+    parser.add_argument("--ues", type=int, default=20, help="UE addresses used by in-process requests")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="LTE-Network-Benchmark", help="results are written to OUT.json and OUT.csv")
+    parser.add_argument("--baseline", help="earlier OUT.json to compare against; regressions exit with status 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative change before a regression is reported")
+    args = parser.parse_args()
+    rates = parse_rates(args.rate)
+    target = InProcessTarget() if args.in_process else HTTPTarget(args.url)
+    if args.in_process:
+        target.call("/SubNetworkLTE/Reset", "127.0.0.1")
+    started = datetime.datetime.today()
+    try:
+        results = asyncio.run(run_benchmark(target, rates, args.duration, args.arrival, args.ues, args.seed))
+    finally:
+        target.close()
+    report = {
+        "target" : target.describe(),
+        "model_version" : model_version(),
+        "started" : str(started),
+        "duration_secs" : args.duration,
+        "arrival" : args.arrival,
+        "seed" : args.seed,
+        "results" : results
+    }
+    write_results(report, args.out)
+    print_table(report)
+    print("Results written to %s.json and %s.csv" % (args.out, args.out))
+    if args.baseline:
+        with open(args.baseline) as handle:
+            found = regressions(report, json.load(handle), args.tolerance)
+        for regression in found:
+            print("REGRESSION %s" % regression)
+        sys.exit(1 if found else 0)
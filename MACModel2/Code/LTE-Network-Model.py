@@ -13,24 +13,45 @@ from flask_cors import CORS
 import sys
 import os
 import json
-from random import random
+import time
+import threading
+from random import random, getrandbits, seed
 import datetime
 from hashlib import md5, sha256
 from math import log10
+from zlib import crc32
+from heapq import heappush, heappop, heapify
+from itertools import count
+from collections import deque
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Process, Pipe
+from bisect import bisect, bisect_left
+from functools import wraps
+from copy import deepcopy
+from mmap import mmap, ACCESS_READ
+from tempfile import mkstemp
+import pickle
+import csv
+import numpy as np
+from numpy.random import SeedSequence, default_rng
 
 app = Flask(__name__)
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
 
 global server_host, server_port, scheduler_events, empty_retry_limit, MAC_packet_size, transmission_bit_limit_per_tti,\
        BER_baseline, retransmission_limit, packet_duplication, effective_delay_budget, min_IP_packet_size, max_IP_packet_size,\
-       Transmission, NETWORK_DATA
+       Transmission, TransmissionQoS, NETWORK_DATA, network_clock, netlog_enabled
 
 #-------------- Network Initialization Parameters --------------
 
 server_host = "localhost"
 server_port = 5000
 scheduler_events = 0
+scheduler_lock = threading.Lock()
 NETWORK_DATA = {}
+network_clock = None # wall clock unless a simulation installs a VirtualClock
+netlog_enabled = True
 
 #-------------- LTE Network Constants ------
 
@@ -41,33 +62,88 @@ NETWORK_DATA = {}
 # Number of sub-carriers = 12
 MAC_packet_size = int(18000/12) # max bits per TTI divided by number of sub-carriers
 transmission_bit_limit_per_tti = 18000
+resource_blocks_per_tti = 100
+bits_per_resource_block = 180 # resource_blocks_per_tti*bits_per_resource_block = transmission_bit_limit_per_tti
+scheduling_mode = "session" # "session" schedules one claimed session per call, "tti" shares each TTI's resource blocks among all backlogged UEs
+throughput_window = 100 # TTIs averaged by the PF throughput estimate
 BER_baseline = 0.2 # Network Bit Error Rate baseline
 retransmission_limit = 4 # Network packet retransmission limit
 packet_duplication = 1 # Network packet duplication
 effective_delay_budget = 300 # effective packet delay budget of 300ms for LTE
 min_IP_packet_size = 3000
 max_IP_packet_size = 5000
+netbuffer_capacity = None # max items held by each queue netbuffer (None = unbounded)
+netbuffer_overflow = "drop" # "drop" discards overflowing items, "backpressure" refuses them so the producer can back off
+integrity_check = "crc32" # MAC packet integrity check over the packed band bits: "crc32" or "sha256" (legacy)
+keep_source_bands = True # MAC packets carry their source band: the profiler compares bits instead of checksums and retransmissions resend it (else a new payload is drawn)
+traffic_seed = None # seed of the UE traffic generator (None = fresh entropy on every start)
+n_cells = 1 # cells modelled by the server; more than one shards the cells across worker processes
+cell_replicas = 100 # points per cell on the consistent hash ring that routes UEs to cells
+snapshot_path = "LTE-Network-State.snapshot" # network state file (cells of a cluster add a .cell-<n> suffix)
+checkpoint_interval = None # seconds between background checkpoints to snapshot_path (None = no checkpoints)
+restore_on_start = False # resume from snapshot_path when the server starts
+netlog_capacity = 10000 # number of most recent events kept by the NetLog
+netlog_page_size = 200
 
 #-------------- Base Classes --------------
 
+def exportable(obj):
+    # JSON form of packet records (and their timestamps) in API responses
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    return str(obj)
+
 def responsify(status,message,data={}):
     code = int(status)
     a_dict = {"data":data,"message":message,"code":code}
     try:
-        return Response(json.dumps(a_dict), status=code, mimetype='application/json')
+        return Response(json.dumps(a_dict, default=exportable), status=code, mimetype='application/json')
     except:
         return Response(str(a_dict), status=code, mimetype='application/json')
 
-def now(): return datetime.datetime.today()
+class VirtualClock:
+    '''
+        Simulated network time, advanced in whole TTIs (1ms)
+    '''
+    def __init__(self, start=datetime.datetime(2020, 1, 1)):
+        self.start = start
+        self.tti = 0
+
+    def now(self):
+        return self.start + datetime.timedelta(milliseconds=self.tti)
+
+    def advance(self, n_ttis=1):
+        self.tti += n_ttis
+
+def now():
+    if network_clock:
+        return network_clock.now()
+    return datetime.datetime.today()
 
 def ms_elapsed(t): return int(1000*(now() - t).total_seconds())
 
+def stamp():
+    # integer timestamp (ms) of the network time, as stored in packet records
+    return int(1000*now().timestamp())
+
+def ms_since(t): return stamp() - t
+
+def from_stamp(t): return datetime.datetime.fromtimestamp(t/1000)
+
+id_sequence = count()
+network_versions = count(1) # netbuffer versions, one sequence for the whole network
+
+def key_hash(key):
+    # stable 32-bit hash of a key (e.g. a UE address), the same in every process
+    return int(md5(str(key).encode('utf-8')).hexdigest()[:8], 16)
+
 def Id(subject=None, upgrade=False):
     hasher = md5(); 
     if upgrade:
         hasher = sha256()
     if not subject:
-        subject = now()
+        # virtual time does not advance within a TTI, so ids also carry a sequence number
+        subject = "%s-%s" % (datetime.datetime.today(), next(id_sequence))
     hasher.update(str(subject).encode('utf-8'))
     return hasher.hexdigest()
 
@@ -75,46 +151,164 @@ def is_transcoding_error(noise_level):
     # generate transcoding error
     return noise_level > BER_baseline
 
-def IP_Packet(sessionId, size, source, time):
-    # This function returns an IP Packet
-    return {
-        "sessionId" : sessionId,
-        "header" : [size, source, time, 0, 0],
-        "payload_bits" : "".join([str(int(random()*2)) for i in range(size)])
-    }
+def copy_containers(value):
+    # copies nested containers (and NumPy state), sharing the packets and other values they hold
+    if isinstance(value, dict):
+        return { key : copy_containers(item) for key, item in value.items() }
+    if isinstance(value, list):
+        return [copy_containers(item) for item in value]
+    if isinstance(value, deque):
+        return deque([copy_containers(item) for item in value], value.maxlen)
+    if isinstance(value, (np.ndarray, np.random.Generator)):
+        return deepcopy(value)
+    return value
+
+class SharedState:
+    '''
+        Base of the network structures shared between request threads. Pickling copies the
+        state under the structure's lock, so snapshots can be taken while it is in use.
+        Versioned structures touch() on every change.
+    '''
+    def touch(self):
+        # versions come from one network-wide sequence, so they keep growing across resets
+        self.version = next(network_versions)
+
+    def __getstate__(self):
+        with self.lock:
+            return copy_containers({ name : value for name, value in self.__dict__.items() if name != "lock" })
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+class PacketRecord:
+    '''
+        Base of the packet records: pickles as a plain tuple of the field values
+    '''
+    __slots__ = ()
+
+    def __getstate__(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+class IPPacket(PacketRecord):
+    '''
+        Compact IP packet record with named header fields. Timestamps are integer ms
+        (see stamp); to_dict gives the published {sessionId, header, payload_bits} form, with
+        the packed payload bits expanded to the legacy "0101..." string.
+    '''
+    __slots__ = ("sessionId", "size", "source", "created", "delay", "retransmissions", "payload_bits")
+
+    def __init__(self, sessionId, size, source, created, payload_bits):
+        self.sessionId = sessionId
+        self.size = size
+        self.source = source
+        self.created = created
+        self.delay = 0
+        self.retransmissions = 0
+        self.payload_bits = payload_bits
+
+    def to_dict(self, exclude=()):
+        # excluded fields are left out before the payload bits are expanded
+        packet = {
+            "sessionId" : self.sessionId,
+            "header" : [self.size, self.source, from_stamp(self.created), self.delay, self.retransmissions]
+        }
+        if "payload_bits" not in exclude:
+            packet["payload_bits"] = unpack_bits(self.payload_bits, self.size)
+        for field in exclude:
+            packet.pop(field, None)
+        return packet
+
+class MACPacket(PacketRecord):
+    '''
+        Compact MAC packet record with named header fields. scheduled is stamped by the
+        sorter; source_bits is only set when MAC packets carry their source band.
+    '''
+    __slots__ = ("sessionId", "delay", "source", "created", "checksum", "retransmissions", "packetId", "index", "count",
+                 "size", "scheduled", "payload_bits", "source_bits")
+
+    def __init__(self, sessionId, payload_bits, source, delay, checksum, retransmissions, packetId, index, count, size, source_bits=None):
+        self.sessionId = sessionId
+        self.delay = delay
+        self.source = source
+        self.created = stamp()
+        self.checksum = checksum
+        self.retransmissions = retransmissions
+        self.packetId = packetId
+        self.index = index
+        self.count = count
+        self.size = size
+        self.scheduled = None
+        self.payload_bits = payload_bits
+        self.source_bits = source_bits
+
+    def to_dict(self, exclude=()):
+        # excluded fields are left out before the payload bits are expanded
+        header = [self.delay, self.source, from_stamp(self.created), self.checksum, self.retransmissions, self.packetId, self.index, self.count, self.size]
+        if self.scheduled is not None:
+            header.append(from_stamp(self.scheduled))
+        packet = {
+            "sessionId" : self.sessionId,
+            "header" : header
+        }
+        if "payload_bits" not in exclude:
+            packet["payload_bits"] = unpack_bits(self.payload_bits, self.size)
+        if self.source_bits is not None and "source_bits" not in exclude:
+            packet["source_bits"] = unpack_bits(self.source_bits, self.size)
+        for field in exclude:
+            packet.pop(field, None)
+        return packet
+
+def IP_Packet(sessionId, size, source, time, payload_bits=None):
+    # This function returns an IP Packet (payload bits are packed into an int, first bit most significant)
+    return IPPacket(sessionId, size, source, time, getrandbits(size) if payload_bits is None else payload_bits)
 
 def MAC2IPSession(MAC_packet):
-    # this function converts a MAC packet back to an IP session for retransmission
-    session_time = now()
-    IP_packet = IP_Packet(MAC_packet["sessionId"], MAC_packet["header"][8], MAC_packet["header"][1], session_time)
-    IP_packet["header"][3] += MAC_packet["header"][0]  # add retransmission delay
-    IP_packet["header"][4] = MAC_packet["header"][4]  # update retransmissions
-    return [MAC_packet["header"][1], session_time, IP_packet["sessionId"], 1, duplicate([IP_packet], packet_duplication)]
-
-def MAC_Packet(sessionId, trans_bits, source, delay, source_bits_hash, retransmissions, packetId, packet_index, n_mac_packets, size):
+    # this function converts a MAC packet back to an IP session for retransmission;
+    # the source band is resent as is, so only fresh packet metadata is created
+    session_time = stamp()
+    IP_packet = IP_Packet(MAC_packet.sessionId, MAC_packet.size, MAC_packet.source, session_time, MAC_packet.source_bits)
+    IP_packet.delay += MAC_packet.delay  # add retransmission delay
+    IP_packet.retransmissions = MAC_packet.retransmissions  # update retransmissions
+    return [MAC_packet.source, session_time, IP_packet.sessionId, 1, duplicate([IP_packet], packet_duplication)]
+
+def MAC_Packet(sessionId, trans_bits, source, delay, source_bits_hash, retransmissions, packetId, packet_index, n_mac_packets, size, source_bits=None):
     # this function returns a MAC packet
-    return {
-        "sessionId" : sessionId,
-        "header" : [delay, source, now(), source_bits_hash, retransmissions, packetId, packet_index, n_mac_packets, size],
-        "payload_bits" : trans_bits
-    }
+    return MACPacket(sessionId, trans_bits, source, delay, source_bits_hash, retransmissions, packetId, packet_index, n_mac_packets, size, source_bits)
+
+def band_checksum(bits, size):
+    # integrity checksum of a packed band
+    if integrity_check == "sha256":
+        return Id(unpack_bits(bits, size), True)
+    return crc32(bits.to_bytes((size + 7) // 8, "big"))
+
+def is_intact(packet):
+    # compares the transmitted band with its source band when the packet carries it, else checks the checksum
+    if packet.source_bits is not None:
+        return packet.payload_bits == packet.source_bits
+    return band_checksum(packet.payload_bits, packet.size) == packet.checksum
+
+def unpack_bits(bits, size):
+    # expands packed payload bits into the "0101..." string form
+    return format(bits, "0%sb" % size) if size else ""
 
 def transcode_bits(bits, plan):
-    # this is the bit transcoding function that copies bits from an IP packet stream into a new MAC packet
+    # this is the bit transcoding function that copies bits from a packed IP packet stream into new MAC packet bands
     noise_level = random()*random()  # random MAC noise level during transcoding
-    field = [x for x in bits]
+    # bit error will occur if cell load increases baseline BER above current noise level;
+    # the noise level is fixed for the whole stream so a band is either flipped entirely or copied
+    flip = is_transcoding_error(noise_level)
+    remaining = sum(plan)
     bands = []
     for size in plan:
-        source = []; trans = []
-        for i in range(size):
-            bit = field.pop(0) # preserve bit order
-            source.append(bit)
-            # bit error will occur if cell load increases baseline BER above current noise level
-            if is_transcoding_error(noise_level):
-                trans.append(str(abs(int(float(bit)-1))))
-            else:
-                trans.append(bit)
-        bands.append(["".join(source), "".join(trans)])
+        remaining -= size
+        mask = (1 << size) - 1
+        source = (bits >> remaining) & mask  # preserve bit order
+        bands.append([source, source ^ mask if flip else source])
     return bands
 
 def transcoding_plan(x, b):
@@ -141,11 +335,430 @@ def duplicate(array, n):
             container.append(obj)
     return container
 
-def UESession(ip_address, n_packets):
+class TrafficGenerator(SharedState):
+    '''
+        Seeded UE traffic backed by NumPy generators. Every UE draws from its own stream,
+        spawned from the generator seed and the UE address, so its traffic is reproducible
+        and independent of other UEs. Arrival models:
+            constant - a burst of burst_size packets every interval ms
+            poisson  - exponential gaps with a mean of interval ms, Poisson burst sizes
+            onoff    - constant bursts during exponential ON periods (mean_on ms),
+                       separated by silent exponential OFF periods (mean_off ms)
+    '''
+    def __init__(self, seed=None, arrival="constant", burst_size=10, interval=1000, mean_on=5000, mean_off=5000):
+        self.seed = SeedSequence(seed).entropy
+        self.arrival_model = arrival
+        self.burst_size = burst_size
+        self.interval = interval
+        self.mean_on = mean_on
+        self.mean_off = mean_off
+        self.UEs = {}
+        self.lock = threading.Lock()
+
+    def stream(self, ip_address):
+        if ip_address not in self.UEs:
+            rng = default_rng(SeedSequence(self.seed, spawn_key=(key_hash(ip_address),)))
+            self.UEs[ip_address] = {
+                "rng" : rng,
+                "arrivals" : 0,
+                "on_left" : rng.exponential(self.mean_on) if self.arrival_model == "onoff" else 0
+            }
+        return self.UEs[ip_address]
+
+    def burst(self, ip_address, n_packets):
+        # sizes and packed payloads of a burst of IP packets, each drawn in one vectorized call
+        with self.lock:
+            rng = self.stream(ip_address)["rng"]
+            sizes = rng.integers(min_IP_packet_size, max(max_IP_packet_size, min_IP_packet_size + 1), n_packets)
+            n_bytes = (sizes + 7) // 8
+            raw = rng.bytes(int(n_bytes.sum()))
+        payloads = []; offset = 0
+        for size, length in zip(sizes.tolist(), n_bytes.tolist()):
+            payloads.append(int.from_bytes(raw[offset:offset + length], "big") >> (8*length - size))
+            offset += length
+        return sizes.tolist(), payloads
+
+    def arrival(self, ip_address):
+        # returns the gap (ms) until the next burst of this UE and its number of packets
+        with self.lock:
+            UE = self.stream(ip_address)
+            rng = UE["rng"]
+            if self.arrival_model == "poisson":
+                return int(rng.exponential(self.interval)), max(int(rng.poisson(self.burst_size)), 1)
+            gap = self.interval if UE["arrivals"] else 0
+            UE["arrivals"] += 1
+            if self.arrival_model == "onoff":
+                UE["on_left"] -= gap
+                if UE["on_left"] < 0:
+                    # the ON period is over: stay silent for an OFF period, then start a new ON period
+                    gap += int(rng.exponential(self.mean_off))
+                    UE["on_left"] = rng.exponential(self.mean_on)
+            return gap, self.burst_size
+
+UETraffic = TrafficGenerator(traffic_seed)
+
+def UESession(ip_address, n_packets, traffic=None):
     # authenticates a UE and creates a session to handle the IP packet uplink
     sessionId = Id()
-    session_time = now()
-    return [ip_address, session_time, sessionId, n_packets, duplicate([IP_Packet(sessionId, packet_size(), ip_address, session_time) for i in range(n_packets)], packet_duplication)]
+    session_time = stamp()
+    ip_address = sys.intern(ip_address)
+    sizes, payloads = (traffic or UETraffic).burst(ip_address, n_packets)
+    return [ip_address, session_time, sessionId, n_packets, duplicate([IP_Packet(sessionId, sizes[i], ip_address, session_time, payloads[i]) for i in range(n_packets)], packet_duplication)]
+
+class NetQueue(SharedState):
+    '''
+        FIFO queue netbuffer with O(1) enqueue and dequeue. A bounded queue either drops
+        the items that overflow it ("drop"), or applies backpressure: producers ask it
+        whether it is accepting before taking on new work, and stall while it is full.
+        Dropped items and refused producer calls are counted.
+    '''
+    def __init__(self, capacity=None, overflow="drop"):
+        self.items = deque()
+        self.capacity = capacity
+        self.overflow = overflow
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.refused = 0
+        self.lock = threading.Lock()
+        self.touch()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def room(self):
+        if self.capacity is None or self.overflow == "backpressure":
+            return None
+        return max(self.capacity - len(self.items), 0)
+
+    def accepting(self):
+        # backpressure check made by producers before they take on work for this queue
+        if self.overflow == "backpressure" and self.capacity is not None and len(self.items) >= self.capacity:
+            with self.lock:
+                self.refused += 1
+                self.touch()
+            return False
+        return True
+
+    def put(self, item, front=False):
+        # enqueue at the tail (or at the head, to be released next); False if the item was dropped
+        with self.lock:
+            self.touch()
+            if self.room() == 0:
+                self.dropped += 1
+                return False
+            if front:
+                self.items.appendleft(item)
+            else:
+                self.items.append(item)
+            self.enqueued += 1
+        return True
+
+    def extend(self, items):
+        # bulk enqueue, returns the number of items accepted
+        items = list(items)
+        with self.lock:
+            room = self.room()
+            if room is not None and room < len(items):
+                self.dropped += len(items) - room
+                items = items[:room]
+            self.items.extend(items)
+            self.enqueued += len(items)
+            self.touch()
+        return len(items)
+
+    def get(self):
+        # dequeue from the head, raises IndexError when empty
+        with self.lock:
+            item = self.items.popleft()
+            self.dequeued += 1
+            self.touch()
+        return item
+
+    def get_many(self, n_items=None):
+        # dequeue up to n_items (everything queued when None) under one lock acquisition
+        with self.lock:
+            if n_items is None:
+                n_items = len(self.items)
+            n_items = max(0, min(n_items, len(self.items)))
+            items = [self.items.popleft() for i in range(n_items)]
+            self.dequeued += n_items
+            if n_items:
+                self.touch()
+        return items
+
+    def to_list(self):
+        return list(self.items)
+
+    def stats(self):
+        return {
+            "length" : len(self.items),
+            "capacity" : self.capacity,
+            "overflow" : self.overflow,
+            "enqueued" : self.enqueued,
+            "dequeued" : self.dequeued,
+            "dropped" : self.dropped,
+            "refused" : self.refused
+        }
+
+class RingLog(SharedState):
+    '''
+        Fixed-capacity event log. Entries are numbered with an increasing sequence number
+        which readers use as a cursor; the oldest entries fall off once the log is full.
+    '''
+    def __init__(self, capacity):
+        self.entries = deque(maxlen=capacity)
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, record):
+        with self.lock:
+            self.sequence += 1
+            self.entries.append((self.sequence,) + record)
+
+    def since(self, cursor=0, limit=None, events=None):
+        # entries after the cursor, oldest first
+        with self.lock:
+            entries = []
+            for entry in reversed(self.entries):
+                if entry[0] <= cursor:
+                    break
+                if not events or entry[4] in events:
+                    entries.append(entry)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def before(self, cursor=None, limit=None, events=None):
+        # entries before the cursor, newest first
+        with self.lock:
+            entries = []
+            for entry in reversed(self.entries):
+                if cursor and entry[0] >= cursor:
+                    continue
+                if not events or entry[4] in events:
+                    entries.append(entry)
+                    if limit and len(entries) == limit:
+                        break
+        return entries
+
+def log_entry(entry, cellId=None):
+    seq, logged, sessionId, color, event, message = entry
+    record = { "seq" : seq, "time" : logged, "sessionId" : sessionId, "event" : event, "message" : message }
+    if cellId is not None:
+        record["cell"] = cellId
+    return record
+
+class SessionTable(SharedState):
+    '''
+        Per-session packet queues awaiting the scheduler. A scheduler claims a free session,
+        which atomically marks it busy and detaches its queued packets, and releases it when
+        they have been scheduled. Packets sorted into a busy session wait for its next claim.
+        Free sessions with queued packets wait in a FIFO ready queue, so claims are O(1).
+    '''
+    def __init__(self):
+        self.sessions = {}
+        self.ready = deque()
+        self.lock = threading.Lock()
+        self.touch()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def add(self, sessionId, packet):
+        with self.lock:
+            if sessionId in self.sessions:
+                self.sessions[sessionId]["packets"].append(packet)
+            else:
+                self.sessions[sessionId] = { "busy" : False, "packets" : deque([packet]) }
+                self.ready.append(sessionId)
+            self.touch()
+
+    def ready_sessions(self):
+        return len(self.ready)
+
+    def claim(self):
+        # returns the sessionId and packets of the next free session, or (None, empty queue)
+        with self.lock:
+            if not self.ready:
+                return None, deque()
+            sessionId = self.ready.popleft()
+            session = self.sessions[sessionId]
+            session["busy"] = True  # lock this queue
+            packets = session["packets"]
+            session["packets"] = deque()
+            self.touch()
+            return sessionId, packets
+
+    def release(self, sessionId):
+        with self.lock:
+            if sessionId in self.sessions:
+                if self.sessions[sessionId]["packets"]:
+                    # packets sorted while the session was claimed
+                    self.sessions[sessionId]["busy"] = False
+                    self.ready.append(sessionId)
+                else:
+                    del self.sessions[sessionId]  # drained sessions leave the table
+                self.touch()
+
+    def to_dict(self):
+        with self.lock:
+            return { sessionId : { "busy" : session["busy"], "packets" : list(session["packets"]) } for sessionId, session in self.sessions.items() }
+
+class ResourceGrid(SharedState):
+    '''
+        Resource block allocation for the "tti" scheduling mode. Sorted packets move into
+        per-UE FIFO buffers, and every scheduling round (one TTI) shares the TTI's resource
+        blocks among all backlogged UEs. The per-UE state is a table of NumPy arrays, so
+        each policy ranks the UEs in one vectorized step:
+            RR - equal shares first, UEs served longest ago first
+            PF - backlog-limited rate over average throughput, highest first
+            NV - head-of-line delay, oldest head packet first
+        Packets are not segmented: a UE sends the head packets that fit in its grant.
+    '''
+    def __init__(self):
+        self.rows = {}  # UE address -> row of the state table
+        self.buffers = []
+        self.backlog = np.zeros(0, dtype=np.int64)  # queued RBs
+        self.throughput = np.zeros(0)  # average bits served per TTI
+        self.last_served = np.zeros(0, dtype=np.int64)  # round in which the UE was last served
+        self.head_since = np.zeros(0, dtype=np.int64)  # scheduler stamp of the head packet
+        self.rounds = 0
+        self.lock = threading.Lock()
+
+    def backlogged(self):
+        return int(np.count_nonzero(self.backlog))
+
+    def row(self, source):
+        if source not in self.rows:
+            if len(self.rows) == len(self.backlog):
+                # grow the state table
+                grow = max(16, len(self.backlog))
+                self.backlog = np.concatenate([self.backlog, np.zeros(grow, dtype=np.int64)])
+                self.throughput = np.concatenate([self.throughput, np.zeros(grow)])
+                self.last_served = np.concatenate([self.last_served, np.zeros(grow, dtype=np.int64)])
+                self.head_since = np.concatenate([self.head_since, np.zeros(grow, dtype=np.int64)])
+            self.rows[source] = len(self.buffers)
+            self.buffers.append(deque())
+        return self.rows[source]
+
+    def admit(self, packets):
+        with self.lock:
+            for packet in packets:
+                row = self.row(packet.source)
+                if not self.buffers[row]:
+                    self.head_since[row] = packet.scheduled
+                self.buffers[row].append(packet)
+                self.backlog[row] += -(-packet.size // bits_per_resource_block)
+
+    def allocate(self, policy):
+        # one TTI: returns the packets sent, the number of UEs served and the RBs used
+        with self.lock:
+            self.rounds += 1
+            n_rows = len(self.buffers)
+            UEs = np.flatnonzero(self.backlog[:n_rows])
+            if policy == "RR":
+                order = UEs[np.argsort(self.last_served[UEs], kind="stable")]
+                shares = [max(1, resource_blocks_per_tti // max(len(UEs), 1)), resource_blocks_per_tti]
+            elif policy == "PF":
+                rate = np.minimum(self.backlog[UEs], resource_blocks_per_tti) * bits_per_resource_block
+                order = UEs[np.argsort(-rate / np.maximum(self.throughput[UEs], 1.0), kind="stable")]
+                shares = [resource_blocks_per_tti]
+            else:
+                order = UEs[np.argsort(self.head_since[UEs], kind="stable")]
+                shares = [resource_blocks_per_tti]
+            served = np.zeros(n_rows)
+            sent = []; free = resource_blocks_per_tti
+            for share in shares:
+                for row in order.tolist():
+                    if not free:
+                        break
+                    grant = min(share, free)
+                    packets = self.buffers[row]
+                    while packets and -(-packets[0].size // bits_per_resource_block) <= grant:
+                        packet = packets.popleft()
+                        blocks = -(-packet.size // bits_per_resource_block)
+                        grant -= blocks; free -= blocks
+                        self.backlog[row] -= blocks
+                        served[row] += packet.size
+                        sent.append(packet)
+                    if packets:
+                        self.head_since[row] = packets[0].scheduled
+            # exponentially weighted average throughput of every UE
+            self.throughput[:n_rows] += (served - self.throughput[:n_rows]) / throughput_window
+            self.last_served[:n_rows][served > 0] = self.rounds
+            return sent, int(np.count_nonzero(served)), resource_blocks_per_tti - free
+
+class QoSAggregator(SharedState):
+    '''
+        Running QoS counters of transmitted packets, indexed by scheduler and session,
+        together with the number of packets rejected for each session
+    '''
+    def __init__(self, schedulers):
+        self.sessions = { scheduler : {} for scheduler in schedulers }
+        self.size = { scheduler : 0 for scheduler in schedulers }
+        self.rejected = {}
+        self.lock = threading.Lock()
+        self.touch()
+
+    def record_transmission(self, scheduler, sessionId, packet, scheduler_delay):
+        with self.lock:
+            self.update(scheduler, sessionId, packet, scheduler_delay)
+            self.touch()
+
+    def update(self, scheduler, sessionId, packet, scheduler_delay):
+        sessions = self.sessions[scheduler]
+        if sessionId in sessions:
+            QoS = sessions[sessionId]
+            QoS["packets_received"] += 1
+            QoS["total_packet_delay"] += packet.delay
+            QoS["total_retransmissions"] += packet.retransmissions
+            QoS["total_scheduler_delay"] += scheduler_delay
+            QoS["total_packet_size"] += packet.size
+        else:
+            sessions[sessionId] = {
+                "packets_received" : 1,
+                "total_packet_delay" : packet.delay,
+                "total_retransmissions" : packet.retransmissions,
+                "total_scheduler_delay" : scheduler_delay,
+                "total_packet_size" : packet.size
+            }
+        self.size[scheduler] += packet.size
+
+    def record_rejection(self, sessionId):
+        with self.lock:
+            self.rejected[sessionId] = self.rejected.get(sessionId, 0) + 1
+            self.touch()
+
+    def summary(self, scheduler):
+        # network-level QoS of one scheduler
+        with self.lock:
+            sessions = self.sessions[scheduler]
+            received = sum([QoS["packets_received"] for QoS in sessions.values()])
+            lost = sum([self.rejected.get(sessionId, 0) for sessionId in sessions])
+            return {
+                "sessions" : len(sessions),
+                "packets_received" : received,
+                "throughput_bits" : self.size[scheduler],
+                "avg_packet_delay" : safely_divide(sum([QoS["total_packet_delay"] for QoS in sessions.values()]), received),
+                "avg_scheduler_delay" : safely_divide(sum([QoS["total_scheduler_delay"] for QoS in sessions.values()]), received),
+                "avg_retransmissions" : safely_divide(sum([QoS["total_retransmissions"] for QoS in sessions.values()]), received),
+                "lost_packets" : lost,
+                "packet_loss_ratio" : safely_divide(100*lost, lost + received)
+            }
+
+    def projection(self, scheduler):
+        # the legacy Transmission[scheduler]["data"] list
+        with self.lock:
+            return [{ "sessionId" : sessionId, "QoS" : dict(QoS, lost_packets=self.rejected.get(sessionId, 0)) } for sessionId, QoS in self.sessions[scheduler].items()]
+
+def new_netqueue():
+    return NetQueue(netbuffer_capacity, netbuffer_overflow)
 
 def NetworkDataManager(netbuffer_host_dir):
     global NETWORK_DATA
@@ -173,17 +786,20 @@ def read_netbuffer(netbuffer_host_dir, netbuffer_type):
         return None
 
 def reset_network():
-    global NETWORK_DATA, Transmission
+    global NETWORK_DATA, Transmission, TransmissionQoS
     Transmission = {
-        "RR" : { "locked" : None, "packets" : [], "data" : [], "size" : 0 },
-        "PF" : { "locked" : None, "packets" : [], "data" : [], "size" : 0 },
-        "NV" : { "locked" : None, "packets" : [], "data" : [], "size" : 0 }
+        "RR" : { "locked" : None, "packets" : [] },
+        "PF" : { "locked" : None, "packets" : [] },
+        "NV" : { "locked" : None, "packets" : [] }
     }
-    write_netbuffer("AirInterface", "UERegister", [])
-    write_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets", [])
-    write_netbuffer("MAC", "TransmissionQueue", [])
-    write_netbuffer("MAC", "RejectedPackets", [])
-    write_netbuffer("Scheduler", "SortedPackets", {})
+    TransmissionQoS = QoSAggregator(Transmission.keys())
+    write_netbuffer("AirInterface", "UERegister", new_netqueue())
+    write_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets", new_netqueue())
+    write_netbuffer("MAC", "TransmissionQueue", new_netqueue())
+    write_netbuffer("MAC", "RejectedPackets", NetQueue())
+    write_netbuffer("Scheduler", "SortedPackets", SessionTable())
+    write_netbuffer("Scheduler", "ResourceGrid", ResourceGrid())
+    write_netbuffer("Scheduler", "Backlog", SchedulerBacklog())
     return 200
 
 def safely_divide(a, b):
@@ -201,25 +817,130 @@ def limit_of_zero(x, override=False):
     else:
         return x
 
+def calc_CQI(packet, default=True):
+    # logarithm of CQI
+    size_term = log10(limit_of_zero(packet.size))
+    delay_term = log10(limit_of_zero(safely_divide(effective_delay_budget, packet.delay)))
+    # a packet at the retransmission limit has no retention left: log10(0) is taken as -inf
+    retention = 1 - packet.retransmissions/retransmission_limit
+    retransmission_term = log10(retention) if retention > 0 else float("-inf")
+    if default:
+        return size_term + delay_term + retransmission_term
+    return size_term - delay_term - retransmission_term
+
+def calc_CQIs(packets, default=True):
+    # calc_CQI of a batch of packets, vectorized over their header fields
+    sizes = np.array([packet.size for packet in packets], dtype=float)
+    delays = np.array([packet.delay for packet in packets], dtype=float)
+    retention = 1 - np.array([packet.retransmissions for packet in packets], dtype=float)/retransmission_limit
+    ratios = np.divide(effective_delay_budget, delays, out=np.ones_like(delays), where=delays != 0)
+    size_term = np.log10(np.where(sizes == 0, 1, sizes))
+    delay_term = np.log10(np.where(ratios == 0, 1, ratios))
+    retransmission_term = np.where(retention > 0, np.log10(np.where(retention > 0, retention, 1)), -np.inf)
+    if default:
+        return size_term + delay_term + retransmission_term
+    return size_term - delay_term - retransmission_term
+
+class CQIQueue:
+    '''
+        Priority queue of MAC packets keyed on (CQI, arrival order): the highest CQI is
+        released first and equal CQIs are released in arrival order. The CQI of a packet
+        is computed once, when it is admitted (vectorized when a batch is admitted).
+    '''
+    def __init__(self, default=True):
+        self.default = default
+        self.heap = []
+        self.arrivals = 0
+        self.size = 0  # total bits queued
+
+    def __len__(self):
+        return len(self.heap)
+
+    def admit(self, packet):
+        heappush(self.heap, (-calc_CQI(packet, self.default), self.arrivals, packet))
+        self.arrivals += 1
+        self.size += packet.size
+
+    def admit_many(self, packets):
+        self.heap.extend(zip((-calc_CQIs(packets, self.default)).tolist(), range(self.arrivals, self.arrivals + len(packets)), packets))
+        heapify(self.heap)
+        self.arrivals += len(packets)
+        self.size += sum([packet.size for packet in packets])
+
+    def drain(self, bit_limit):
+        # release the next TTI group: packets are added while the group is within the bit limit
+        group = []; group_size = 0
+        while self.heap and group_size <= bit_limit:
+            packet = heappop(self.heap)[2]
+            group_size += packet.size
+            group.append(packet)
+        self.size -= group_size
+        return group, group_size
+
+    def drain_all(self):
+        group = []
+        while self.heap:
+            group.append(heappop(self.heap)[2])
+        self.size = 0
+        return group
+
+    def to_list(self):
+        # queued packets in release order
+        return [entry[2] for entry in sorted(self.heap)]
+
+def drain_fifo(packets, bit_limit):
+    # release the next TTI group of a FIFO queue, as CQIQueue.drain does
+    group = []; group_size = 0
+    while packets and group_size <= bit_limit:
+        packet = packets.popleft()
+        group_size += packet.size
+        group.append(packet)
+    return group, group_size
+
+class SchedulerBacklog(SharedState):
+    '''
+        Packets of claimed sessions that are still waiting for a TTI, kept per scheduler in
+        a FIFO (RR) or a CQI queue (PF, NV) so that every scheduling round drains one TTI
+        group. A round takes a session's queue out, and puts it back at the end of the
+        scheduler's round robin while packets remain; the session stays claimed until then.
+    '''
+    def __init__(self, schedulers=("RR", "PF", "NV")):
+        self.queues = { scheduler : {} for scheduler in schedulers }
+        self.order = { scheduler : deque() for scheduler in schedulers }
+        self.lock = threading.Lock()
+        self.touch()
+
+    def __len__(self):
+        return sum([len(self.order[scheduler]) for scheduler in self.order])
+
+    def take(self, scheduler):
+        # the next backlogged session of a scheduler and its queue, or (None, None)
+        with self.lock:
+            if not self.order[scheduler]:
+                return None, None
+            sessionId = self.order[scheduler].popleft()
+            self.touch()
+            return sessionId, self.queues[scheduler].pop(sessionId)
+
+    def put(self, scheduler, sessionId, queue):
+        with self.lock:
+            self.queues[scheduler][sessionId] = queue
+            self.order[scheduler].append(sessionId)
+            self.touch()
+
+    def to_dict(self):
+        with self.lock:
+            return { scheduler : { sessionId : (list(queue) if isinstance(queue, deque) else queue.to_list()) for sessionId, queue in sessions.items() } for scheduler, sessions in self.queues.items() }
+
 def CQI_Prioritization(packets, default=True):
     '''
         Factors considered include: packet size, packet delay and retransmissions. 
         Emphasis is on maximizing throughput by sending the highest quality packets.
         Larger packets with smaller delays and lower retransmission rates are prioritized. 
     '''
-    def calc_CQI(packet):
-        # logarithm of CQI
-        if default:
-            cqi = log10(limit_of_zero(packet["header"][8])) + log10(limit_of_zero(safely_divide(effective_delay_budget, packet["header"][0]))) + log10(limit_of_zero((1 - packet["header"][4]/retransmission_limit), True))
-        else:
-            cqi = log10(limit_of_zero(packet["header"][8])) - log10(limit_of_zero(safely_divide(effective_delay_budget, packet["header"][0]))) - log10(limit_of_zero((1 - packet["header"][4]/retransmission_limit), True))
-        return cqi 
-    CQIs = [calc_CQI(packet) for packet in packets];
-    CQIs_ = [calc_CQI(packet) for packet in packets];
-    CQIs_.sort()
-    CQIs_.reverse()
-    prioritized = [packets[CQIs.index(CQI)] for CQI in CQIs_];
-    return prioritized
+    queue = CQIQueue(default)
+    queue.admit_many(packets)
+    return queue.drain_all()
 
 def log(sessionId, request, response):
     # this is the logging function that produces color-coded records of events that occur in the network
@@ -233,15 +954,13 @@ def log(sessionId, request, response):
             "SORTED_PACKET": "pink",
             "SCHEDULER_EMPTY_STATE" : "yellow",
             "SCHEDULER_ALLOCATED_STATE" : "cyan",
-            "SCHEDULED_PACKETS" : "orange"
+            "SCHEDULED_PACKETS" : "orange",
+            "BATCH_PROCESSED" : "white"
         }
         return str(now()), sessionId, colorMap[request], request, response
-    Log = read_netbuffer("NetLog", "log")
-    if Log:
-        Log.append(format())
-    else:
-        Log = [format()]
-    write_netbuffer("NetLog", "log", Log)
+    if not netlog_enabled:
+        return None
+    read_netbuffer("NetLog", "log").append(format())
     return None
 
 #-------------- Component Data Models --------------
@@ -250,338 +969,1090 @@ AirInterface = NetworkDataManager("AirInterface") # Handles initial packets ente
 PhysicalUplinkControlChannel = NetworkDataManager("PhysicalUplinkControlChannel") # Modulates IP packets to MAC packets
 MAC = NetworkDataManager("MAC") # validates packets and handles retransmissions or queueing of verified packets
 Scheduler = NetworkDataManager("Scheduler") # sorts verified packets and schedules transmission of packets
+
 Transmission = {
-        "RR" : { "locked" : None, "packets" : [], "data" : [], "size" : 0 },
-        "PF" : { "locked" : None, "packets" : [], "data" : [], "size" : 0 },
-        "NV" : { "locked" : None, "packets" : [], "data" : [], "size" : 0 }
+        "RR" : { "locked" : None, "packets" : [] },
+        "PF" : { "locked" : None, "packets" : [] },
+        "NV" : { "locked" : None, "packets" : [] }
 }
-register_new_netbuffer("AirInterface", "UERegister", [])
-register_new_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets", [])
-register_new_netbuffer("MAC", "TransmissionQueue", [])
-register_new_netbuffer("MAC", "RejectedPackets", [])
-register_new_netbuffer("Scheduler", "SortedPackets", {})
+TransmissionQoS = QoSAggregator(Transmission.keys())
+register_new_netbuffer("AirInterface", "UERegister", new_netqueue())
+register_new_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets", new_netqueue())
+register_new_netbuffer("MAC", "TransmissionQueue", new_netqueue())
+register_new_netbuffer("MAC", "RejectedPackets", NetQueue())
+register_new_netbuffer("Scheduler", "SortedPackets", SessionTable())
+register_new_netbuffer("Scheduler", "ResourceGrid", ResourceGrid())
+register_new_netbuffer("Scheduler", "Backlog", SchedulerBacklog())
 
 def transmit(locked, scheduler, packet):
     # transmits and terminates scheduled packets
-    # old pkt loss: packet_duplication*packet["header"][7] - 1
-    global Transmission
-    scheduler_delay = ms_elapsed(packet["header"][-1]);
-    matching_index = None
-    if (len(Transmission[scheduler]["data"]) == 0):
-        Transmission[scheduler]["data"].append({
-            "sessionId" : locked,
-            "QoS" : {
-                 "packets_received" : 1,
-                 "total_packet_delay" : packet["header"][0],
-                 "total_retransmissions" : packet["header"][4],
-                 "total_scheduler_delay" : scheduler_delay,
-                 "total_packet_size" : packet["header"][8],
-                 "lost_packets" : len([packet for packet in read_netbuffer("MAC", "RejectedPackets") if packet["sessionId"] == locked])
-            }
-        })
-    else:
-        matching = [Transmission[scheduler]["data"].index(data) for data in Transmission[scheduler]["data"] if data["sessionId"] == locked]
-        if matching:
-            matching_index = matching[0];
-            Transmission[scheduler]["data"][matching_index]["QoS"]["packets_received"]+=1
-            Transmission[scheduler]["data"][matching_index]["QoS"]["total_packet_delay"]+=packet["header"][0]
-            Transmission[scheduler]["data"][matching_index]["QoS"]["total_retransmissions"]+=packet["header"][4]
-            Transmission[scheduler]["data"][matching_index]["QoS"]["total_scheduler_delay"]+=scheduler_delay
-            Transmission[scheduler]["data"][matching_index]["QoS"]["total_packet_size"] += packet["header"][8]
-            Transmission[scheduler]["data"][matching_index]["QoS"]["lost_packets"] = len([packet for packet in read_netbuffer("MAC", "RejectedPackets") if packet["sessionId"] == locked])
-        else:
-            Transmission[scheduler]["data"].append({
-                "sessionId" : locked,
-                "QoS" : {
-                     "packets_received" : 1,
-                     "total_packet_delay" : packet["header"][0],
-                     "total_retransmissions" : packet["header"][4],
-                     "total_scheduler_delay" : scheduler_delay,
-                     "total_packet_size" : packet["header"][8],
-                     "lost_packets": len([packet for packet in read_netbuffer("MAC", "RejectedPackets") if packet["sessionId"] == locked])
-                }
-            })
-    Transmission[scheduler]["size"] += packet["header"][8]
+    # old pkt loss: packet_duplication*packet.count - 1
+    TransmissionQoS.record_transmission(scheduler, locked, packet, ms_since(packet.scheduled))
     return 200
 
+def transmission_view():
+    # the Transmission data structure as published by the Inspect API, derived from the QoS aggregates
+    return {
+        scheduler : {
+            "locked" : Transmission[scheduler]["locked"],
+            "packets" : list(Transmission[scheduler]["packets"]),
+            "data" : TransmissionQoS.projection(scheduler),
+            "size" : TransmissionQoS.size[scheduler]
+        } for scheduler in Transmission
+    }
+
 NetLog = NetworkDataManager("NetLog") # records events in the network
+register_new_netbuffer("NetLog", "log", RingLog(netlog_capacity))
 
-#-------------- Network Endpoints --------------
+#-------------- Stage Metrics --------------
 
-# inspect data structures
-@app.route("/SubNetworkLTE/Internal/Inspect/<path:section>")
-def InspectData(section):
-    payload = {
+class StageMetrics:
+    '''
+        Call counts by response code and latency histograms of the network stages, kept
+        as plain counters so recording a call costs one lock acquisition
+    '''
+    buckets = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0]  # seconds
+
+    def __init__(self):
+        self.calls = {}  # (stage, code) -> calls
+        self.latency = {}  # stage -> calls per bucket (the last one is +Inf), then the total seconds
+        self.lock = threading.Lock()
+
+    def record(self, stage, code, seconds):
+        bucket = bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.calls[(stage, code)] = self.calls.get((stage, code), 0) + 1
+            if stage not in self.latency:
+                self.latency[stage] = [0 for i in range(len(self.buckets) + 1)] + [0.0]
+            self.latency[stage][bucket] += 1
+            self.latency[stage][-1] += seconds
+
+    def families(self):
+        with self.lock:
+            calls = dict(self.calls)
+            latency = { stage : list(histogram) for stage, histogram in self.latency.items() }
+        histograms = []
+        for stage, histogram in latency.items():
+            cumulative = 0
+            for bound, n_calls in zip(self.buckets + ["+Inf"], histogram):
+                cumulative += n_calls
+                histograms.append(("_bucket", { "stage" : stage, "le" : bound }, cumulative))
+            histograms += [("_sum", { "stage" : stage }, histogram[-1]), ("_count", { "stage" : stage }, cumulative)]
+        outcomes = { "201" : "queued", "200" : "retransmitted", "204" : "rejected", "503" : "lost" }
+        return [
+            ("lte_stage_calls_total", "counter", "Stage calls by response code",
+                [("", { "stage" : stage, "code" : code }, n_calls) for (stage, code), n_calls in calls.items()]),
+            ("lte_stage_latency_seconds", "histogram", "Stage call latency", histograms),
+            ("lte_profiled_packets_total", "counter", "MAC packets profiled by outcome",
+                [("", { "outcome" : outcomes.get(code, "failed") }, n_calls) for (stage, code), n_calls in calls.items() if stage == "ProfilePacket"])
+        ]
+
+Metrics = StageMetrics()
+
+def instrumented(stage):
+    # records the calls and latency of a stage function; stages return "code: message" or (code, summary)
+    def instrument(function):
+        @wraps(function)
+        def measured(*args, **kwargs):
+            started = time.perf_counter()
+            response = function(*args, **kwargs)
+            code = response[0] if isinstance(response, tuple) else str(response).split(":")[0]
+            Metrics.record(stage, str(code), time.perf_counter() - started)
+            return response
+        return measured
+    return instrument
+
+def network_metrics():
+    # metric families of this network: (name, type, help, [(suffix, labels, value)])
+    netqueues = {
         "UERegister" : read_netbuffer("AirInterface", "UERegister"),
         "QueuedMACPackets" : read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets"),
-        "TransmissionQueue" : read_netbuffer("MAC", "TransmissionQueue"),
-        "RejectedPackets" : read_netbuffer("MAC", "RejectedPackets"),
-        "SortedPackets" : read_netbuffer("Scheduler", "SortedPackets"),
-        "Transmission" : Transmission,
-        "Pending": len(read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets")),
-        "Rejected": [packet["sessionId"] for packet in read_netbuffer("MAC", "RejectedPackets")]
+        "TransmissionQueue" : read_netbuffer("MAC", "TransmissionQueue")
     }
-    if section == "all":
-        selection = payload
-    else:
-        selection = payload[section]
-    return responsify(200, "%s data attached" % section, selection)
+    stats = { name : netqueue.stats() for name, netqueue in netqueues.items() }
+    depths = [("", { "netbuffer" : name }, stats[name]["length"]) for name in stats]
+    depths += [
+        ("", { "netbuffer" : "RejectedPackets" }, len(read_netbuffer("MAC", "RejectedPackets"))),
+        ("", { "netbuffer" : "SortedPackets" }, len(read_netbuffer("Scheduler", "SortedPackets"))),
+        ("", { "netbuffer" : "ResourceGrid" }, read_netbuffer("Scheduler", "ResourceGrid").backlogged())
+    ]
+    overflows = [("", { "netbuffer" : name, "action" : action }, stats[name][action]) for name in stats for action in ["dropped", "refused"]]
+    with TransmissionQoS.lock:
+        bits = [("", { "scheduler" : scheduler }, size) for scheduler, size in TransmissionQoS.size.items()]
+        packets = [("", { "scheduler" : scheduler }, sum([QoS["packets_received"] for QoS in sessions.values()])) for scheduler, sessions in TransmissionQoS.sessions.items()]
+    return Metrics.families() + [
+        ("lte_netbuffer_depth", "gauge", "Items held by each netbuffer (sessions for SortedPackets, backlogged UEs for ResourceGrid)", depths),
+        ("lte_netbuffer_overflow_total", "counter", "Items dropped or refused by full netbuffers", overflows),
+        ("lte_transmitted_bits_total", "counter", "Bits transmitted per scheduler since the last reset", bits),
+        ("lte_transmitted_packets_total", "counter", "MAC packets transmitted per scheduler since the last reset", packets)
+    ]
 
-# Reset
-@app.route("/SubNetworkLTE/Reset")
-def Reset():
-    return str(reset_network())
+def render_metrics(families):
+    # Prometheus text exposition format
+    lines = []
+    for name, kind, description, samples in families:
+        lines += ["# HELP %s %s" % (name, description), "# TYPE %s %s" % (name, kind)]
+        for suffix, labels, value in samples:
+            labelled = "{%s}" % ",".join(['%s="%s"' % item for item in labels.items()]) if labels else ""
+            lines.append("%s%s%s %s" % (name, suffix, labelled, value))
+    return "\n".join(lines) + "\n"
 
-# schedule packets
-@app.route("/SubNetworkLTE/Scheduler/Schedule")
-def SchedulePackets():
+#-------------- Network Stages --------------
+
+# scheduling of sorted packets per session
+@instrumented("Scheduler")
+def schedule_packets():
     global Transmission, scheduler_events
-    def Schedule(scheduler):
-        locked = Transmission[scheduler]["locked"]
-        packets = Transmission[scheduler]["packets"]
-        if scheduler == "RR":
-            # check size constraint
-            total_size = sum([packet["header"][-2] for packet in packets]);
-            if (total_size <= transmission_bit_limit_per_tti):
-                # send all packets on FIFO basis
-                group = packets[::-1]; group_size = total_size
-                process = [transmit(locked, scheduler, packet) for packet in group];
+    if scheduling_mode == "tti":
+        return schedule_tti()
+    try:
+        with scheduler_lock:
+            scheduler_events+=1
+            schedulers = ["RR", "PF", "NV"]
+            scheduler = schedulers[scheduler_events % len(schedulers)]
+        # one TTI per round: a scheduler drains its backlogged sessions before it claims another
+        SortedPackets = read_netbuffer("Scheduler", "SortedPackets")
+        Backlog = read_netbuffer("Scheduler", "Backlog")
+        locked, queue = Backlog.take(scheduler)
+        if queue is None:
+            # allocation: packets are admitted once, FIFO for RR and by CQI for PF and NV
+            # (NV inverts the delay and retransmission factors)
+            locked, packets = SortedPackets.claim()
+            log(locked, "SCHEDULER_ALLOCATED_STATE", "Scheduler: %s has been allocated %s packets" % (scheduler, len(packets)))
+            if scheduler == "RR":
+                queue = packets
             else:
-                # audit and send on FIFO basis
-                while len(packets) > 0:
-                    group = []; group_size = 0; proceed = True
-                    while (group_size <= transmission_bit_limit_per_tti and proceed):
-                        if len(packets) > 0:
-                            packet = packets.pop()
-                            group_size += packet["header"][-2]
-                            group.append(packet)
-                        else:
-                            proceed = False
-                    # send group
-                    process = [transmit(locked, scheduler, packet) for packet in group];
-        if scheduler == "PF":
-            # packet CQI Prioritization
-            packets = CQI_Prioritization(packets);
-            # check size constraint
-            total_size = sum([packet["header"][-2] for packet in packets]);
-            if (total_size <= transmission_bit_limit_per_tti):
-                # send all packets after CQI prioritization
-                group = packets; group_size = total_size
-                process = [transmit(locked, scheduler, packet) for packet in group];
+                queue = CQIQueue(scheduler == "PF")
+                queue.admit_many(packets)
+        try:
+            # send the next group within the size constraint
+            if scheduler == "RR":
+                group, group_size = drain_fifo(queue, transmission_bit_limit_per_tti)
             else:
-                # audit and send on CQI basis
-                while len(packets) > 0:
-                    group = []; group_size = 0; proceed = True
-                    while (group_size <= transmission_bit_limit_per_tti and proceed):
-                        if len(packets) > 0:
-                            packet = packets.pop(0)
-                            group_size += packet["header"][-2]
-                            group.append(packet)
-                        else:
-                            proceed = False
-                    # send group
-                    process = [transmit(locked, scheduler, packet) for packet in group];
-        if scheduler == "NV":
-            # packet CQI Prioritization (size only)
-            packets = CQI_Prioritization(packets, False)
-            # check size constraint
-            total_size = sum([packet["header"][-2] for packet in packets])
-            if (total_size <= transmission_bit_limit_per_tti):
-                # send all packets after CQI prioritization
-                group = packets
-                group_size = total_size
-                process = [transmit(locked, scheduler, packet) for packet in group]
+                group, group_size = queue.drain(transmission_bit_limit_per_tti)
+            # register on Transmission
+            Transmission[scheduler] = { "locked" : locked, "packets" : group }
+            TransmissionQoS.touch()
+            process = [transmit(locked, scheduler, packet) for packet in group]
+        finally:
+            if len(queue):
+                Backlog.put(scheduler, locked, queue)
             else:
-                # audit and send on CQI basis
-                while len(packets) > 0:
-                    group = []
-                    group_size = 0
-                    proceed = True
-                    while (group_size <= transmission_bit_limit_per_tti and proceed):
-                        if len(packets) > 0:
-                            packet = packets.pop(0)
-                            group_size += packet["header"][-2]
-                            group.append(packet)
-                        else:
-                            proceed = False
-                    # send group
-                    process = [transmit(locked, scheduler, packet) for packet in group]
+                SortedPackets.release(locked)
         log(locked, "SCHEDULED_PACKETS", "%s packets with total size: %s bits were scheduled by: %s" % (len(group), group_size, scheduler))
         return "%s: %s" % (200, "Packets were scheduled (%s bits)" % group_size)
-    def isolate_free_MAC_packets(isolated=None):
-        SortedPackets = read_netbuffer("Scheduler", "SortedPackets");
-        if not isolated:
-            packets = [];
-            for sessionId in SortedPackets:
-                if not SortedPackets[sessionId]["busy"]:
-                    isolated = sessionId
-                    SortedPackets[sessionId]["busy"] = True;  # lock this queue
-                    break;
-        try:
-            # detach packets
-            packets = SortedPackets[isolated]["packets"]
-            SortedPackets[isolated]["packets"] = []
-        except:
-            pass
-        # update SortedPackets
-        write_netbuffer("Scheduler", "SortedPackets", SortedPackets);
-        return isolated, packets
+    except Exception as e:
+        print("Error @ scheduler : %s" % str(e))
+        return "%s: %s" % (400, str(e))
+
+# scheduling of all backlogged UEs in one TTI
+def schedule_tti():
+    global Transmission, scheduler_events
     try:
-        scheduler_events+=1
-        schedulers = ["RR", "PF", "NV"]
-        scheduler = schedulers[scheduler_events % len(schedulers)]
+        with scheduler_lock:
+            scheduler_events+=1
+            schedulers = ["RR", "PF", "NV"]
+            scheduler = schedulers[scheduler_events % len(schedulers)]
+        # move the sorted sessions into the UE buffers
+        SortedPackets = read_netbuffer("Scheduler", "SortedPackets")
+        Grid = read_netbuffer("Scheduler", "ResourceGrid")
+        while True:
+            sessionId, packets = SortedPackets.claim()
+            if sessionId is None:
+                break
+            Grid.admit(packets)
+            SortedPackets.release(sessionId)
         # allocation
-        locked, packets = isolate_free_MAC_packets()
-        # register on Transmission
-        Transmission[scheduler]["locked"] = locked
-        Transmission[scheduler]["packets"] = packets
-        log(locked, "SCHEDULER_ALLOCATED_STATE", "Scheduler: %s has been allocated %s packets" % (scheduler, len(packets)))
-        return Schedule(scheduler)
+        group, n_UEs, n_blocks = Grid.allocate(scheduler)
+        Transmission[scheduler] = { "locked" : None, "packets" : group }
+        TransmissionQoS.touch()
+        group_size = 0
+        for packet in group:
+            transmit(packet.sessionId, scheduler, packet)
+            group_size += packet.size
+        if group:
+            log(None, "SCHEDULED_PACKETS", "%s packets from %s UEs with total size: %s bits were scheduled in %s RBs by: %s" % (len(group), n_UEs, group_size, n_blocks, scheduler))
+        return "%s: %s" % (200, "Packets were scheduled (%s bits)" % group_size)
     except Exception as e:
         print("Error @ scheduler : %s" % str(e))
         return "%s: %s" % (400, str(e))
 
+# sorting of verified packets by session
+def sort_packet(packet, verbose=True):
+    # add scheduler start
+    packet.scheduled = stamp()
+    sessionId = packet.sessionId
+    read_netbuffer("Scheduler", "SortedPackets").add(sessionId, packet)
+    if verbose:
+        log(sessionId, "SORTED_PACKET", "1 packet with id: %s was sorted (%s bits)" % (packet.packetId, packet.size))
+    return "%s: %s" % (201, "Packet was sorted (%s bits)" % packet.size)
+
+@instrumented("Sorter")
+def sort_packets():
+    try:
+        return sort_packet(read_netbuffer("MAC", "TransmissionQueue").get())  # release a MAC packet
+    except Exception as e:
+        print("Error @ sorter : %s" % str(e))
+        return "%s: %s" % (404, "No packet found")
+
+# validation of packet integrity
+def retransmit_packet(packet, verbose=True):
+    # check if retransmission_limit reached
+    if packet.retransmissions + 1 > retransmission_limit:
+        # reject this MAC packet
+        read_netbuffer("MAC", "RejectedPackets").put(packet)
+        TransmissionQoS.record_rejection(packet.sessionId)
+        if verbose:
+            log(packet.sessionId, "REJECTED_PACKET", "1 packet with id: %s was rejected (%s bits)" % (packet.packetId, packet.size))
+        return "%s: %s" % (204, "Packet was rejected (%s bits)" % packet.size)
+    else:
+        packet.retransmissions+=1
+        retransmitted_session = MAC2IPSession(packet) # convert MAC packet back to IP session
+        # retransmit IP session, released ahead of sessions waiting in the register
+        if not read_netbuffer("AirInterface", "UERegister").put(retransmitted_session, front=True):
+            if verbose:
+                log(packet.sessionId, "REJECTED_PACKET", "1 packet with id: %s was lost to a full UE register (%s bits)" % (packet.packetId, packet.size))
+            return "%s: %s" % (503, "Packet could not be retransmitted, UE register is full (%s bits)" % packet.size)
+        if verbose:
+            log(packet.sessionId, "RETRANSMITTED_PACKET", "1 packet with id: %s was retransmitted (%s bits)" % (packet.packetId, packet.size))
+        return "%s: %s" % (200, "Packet was retransmitted (%s bits)" % packet.size)
+
+def queue_packet(packet, verbose=True):
+    # queue this transmittable MAC packet
+    if not read_netbuffer("MAC", "TransmissionQueue").put(packet):
+        if verbose:
+            log(packet.sessionId, "REJECTED_PACKET", "1 packet with id: %s was lost to a full transmission queue (%s bits)" % (packet.packetId, packet.size))
+        return "%s: %s" % (503, "Packet could not be queued, transmission queue is full (%s bits)" % packet.size)
+    if verbose:
+        log(packet.sessionId, "QUEUED_PACKET", "1 packet with id: %s was queued (%s bits)" % (packet.packetId, packet.size))
+    return "%s: %s" % (201, "Packet was queued (%s bits)" % packet.size)
+
+@instrumented("ProfilePacket")
+def profile_packet(packet, verbose=True):
+    # test MAC packet for errors, handle contextually
+    if is_intact(packet):
+        return queue_packet(packet, verbose)
+    else:
+        return retransmit_packet(packet, verbose)
+
+@instrumented("Profiler")
+def profile_packets():
+    try:
+        if not read_netbuffer("MAC", "TransmissionQueue").accepting():
+            return "%s: %s" % (503, "Transmission queue is full")
+        return profile_packet(read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets").get()) # release a MAC packet
+    except Exception as e:
+        print("Error @ profiler : %s" % str(e))
+        return "%s: %s" % (404, "No packet found")
+
+# transcoding of IP packets to MAC packets
+def modulate_session(session, verbose=True):
+    # modulates the IP packets of a session, returns the number of MAC packets queued
+    QueuedMACPackets = read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets")
+    ip_address, session_time, sessionId, n_packets, ip_packets_loggable = session
+    ip_packets = [log for log in ip_packets_loggable]
+    # Packet Modulation
+    delay = ms_since(session_time); modulated = 0
+    for packet in ip_packets:
+        delay+=packet.delay  # add retransmission delay
+        mod_started = now()
+        MAC_packets = []
+        packetId = Id()
+        plan = transcoding_plan(packet.size, MAC_packet_size)
+        field = transcode_bits(packet.payload_bits, plan)
+        packet_index = -1
+        for band in field:
+            packet_index+=1
+            source_bits, trans_bits = band
+            band_size = plan[packet_index]
+            mod_delay = ms_elapsed(mod_started); delay+=mod_delay # add modulation delay
+            # FIFO Queue, preserve retransmissions
+            MAC_packets.append(MAC_Packet(sessionId, trans_bits, ip_address, delay, band_checksum(source_bits, band_size), packet.retransmissions, packetId, packet_index, len(field), band_size, source_bits if keep_source_bands else None))
+        modulated+=QueuedMACPackets.extend(MAC_packets) # bands are queued in bit order
+        if verbose:
+            log(sessionId, "MAC_PACKETS_MODULATED", "%s MAC packets from session %s delayed %sms" % (len(MAC_packets), sessionId, mod_delay))
+    return modulated
+
+@instrumented("Modulation")
+def modulate_packets():
+    UERegister = read_netbuffer("AirInterface", "UERegister")
+    if UERegister:
+        if not read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets").accepting():
+            return "%s: %s" % (503, "MAC packet queue is full")
+        sessions = UERegister.get_many(1) # empty if a concurrent call took the last session
+        if sessions:
+            modulated = modulate_session(sessions[0])
+            return "%s: %s" % (200, "Successfully modulated %s packets" % modulated)
+    return "%s: %s" % (404, "No session found")
+
+# batch draining of stage queues
+def batch_summary(stage, n_items, started, drained, outcomes):
+    # aggregate result of a batch, logged as one record
+    duration_ms = 1000*(datetime.datetime.today() - started).total_seconds()
+    summary = {
+        "stage" : stage,
+        "requested" : n_items if n_items is not None else "all",
+        "drained" : drained,
+        "outcomes" : outcomes,
+        "duration_ms" : round(duration_ms, 3),
+        "mean_item_us" : round(1000*duration_ms/drained, 3) if drained else 0
+    }
+    if drained:
+        log(None, "BATCH_PROCESSED", "%s batch drained %s items in %sms %s" % (stage, drained, summary["duration_ms"], outcomes))
+    return summary
+
+def drain_outcomes(items, process, labels):
+    # runs process on each drained item and counts the outcomes by response code
+    outcomes = {}
+    for item in items:
+        label = labels.get(process(item, False).split(":")[0], "failed")
+        outcomes[label] = outcomes.get(label, 0) + 1
+    return outcomes
+
+@instrumented("ModulationBatch")
+def modulate_batch(n_items=None):
+    started = datetime.datetime.today()
+    if not read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets").accepting():
+        return 503, batch_summary("Modulation", n_items, started, 0, {})
+    sessions = read_netbuffer("AirInterface", "UERegister").get_many(n_items)
+    modulated = sum([modulate_session(session, False) for session in sessions])
+    return (200 if sessions else 404), batch_summary("Modulation", n_items, started, len(sessions), { "MAC_packets" : modulated })
+
+@instrumented("ProfilerBatch")
+def profile_batch(n_items=None):
+    started = datetime.datetime.today()
+    if not read_netbuffer("MAC", "TransmissionQueue").accepting():
+        return 503, batch_summary("Profiler", n_items, started, 0, {})
+    packets = read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets").get_many(n_items)
+    outcomes = drain_outcomes(packets, profile_packet, { "201" : "queued", "200" : "retransmitted", "204" : "rejected", "503" : "lost" })
+    return (200 if packets else 404), batch_summary("Profiler", n_items, started, len(packets), outcomes)
+
+@instrumented("SorterBatch")
+def sort_batch(n_items=None):
+    started = datetime.datetime.today()
+    packets = read_netbuffer("MAC", "TransmissionQueue").get_many(n_items)
+    outcomes = drain_outcomes(packets, sort_packet, { "201" : "sorted" })
+    return (200 if packets else 404), batch_summary("Sorter", n_items, started, len(packets), outcomes)
+
+# authentication of UE sessions and reception of IP packets
+def register_UE_session(ip_address, n_packets, traffic=None):
+    # a refused burst is turned away before it draws from the UE's traffic stream
+    UERegister = read_netbuffer("AirInterface", "UERegister")
+    if not UERegister.accepting():
+        return "%s: %s" % (503, "UE register is full, try again later")
+    try:
+        session = UESession(ip_address, int(n_packets), traffic)
+    except Exception as e:
+        print("Error @ create_session : %s" % str(e))
+        return "%s: %s" % (400, "Error creating session: packet_size not specified")
+    if not UERegister.put(session):  #FIFO Queue
+        return "%s: %s" % (503, "UE register is full, session was dropped")
+    log(session[2], "IP_PACKETS_RECEIVED", 'UE at <span style="color: cyan;">%s</span> sent %s IP packets of %s bits' % (ip_address, n_packets, sum([this_packet.size for this_packet in session[4]])))
+    return "%s: %s" % (200, "Successfully registered %s packets" % n_packets)
+
+#-------------- Headless Simulation Engine --------------
+
+class NetworkSimulator:
+    '''
+        Runs the network stages in-process as discrete events on the virtual TTI clock.
+        Every stage is an event that re-arms itself at its own interval while its input
+        netbuffer holds work, and idle stages are woken again as soon as upstream stages
+        produce work for them, so quiet periods of simulated time cost nothing.
+        Each UE sends its bursts as its own stream of arrival events from a seeded
+        TrafficGenerator (see there for the arrival models).
+    '''
+    stages = ["UERegistration", "Modulation", "Profiler", "Sorter", "Schedule"]
+    wakes = {
+        "UERegistration" : ["Modulation"],
+        "Modulation" : ["Profiler"],
+        "Profiler" : ["Sorter", "Modulation"],  # verified packets are queued, failed packets are retransmitted
+        "Sorter" : ["Schedule"],
+        "Schedule" : []
+    }
+
+    def __init__(self, UEs=["10.0.0.1"], burst_size=10, burst_interval=1000, modulation_interval=1, profiler_interval=1,
+                 sorter_interval=1, scheduler_interval=1, reset_interval=None, logging=False, arrival="constant",
+                 mean_on=5000, mean_off=5000, seed=None):
+        self.UEs = UEs
+        self.traffic = TrafficGenerator(seed, arrival, burst_size, burst_interval, mean_on, mean_off)
+        self.bursts = {}
+        self.intervals = {
+            "Modulation" : modulation_interval,
+            "Profiler" : profiler_interval,
+            "Sorter" : sorter_interval,
+            "Schedule" : scheduler_interval
+        }
+        self.reset_interval = reset_interval
+        self.next_reset = reset_interval
+        self.logging = logging
+        self.clock = VirtualClock()
+        self.events = []
+        self.pending = {}
+        self.sequence = 0
+        self.event_counts = { stage : 0 for stage in self.stages }
+
+    def schedule(self, stage, tti, ip_address=None):
+        if (stage, ip_address) not in self.pending:
+            self.sequence += 1
+            self.pending[(stage, ip_address)] = tti
+            heappush(self.events, (tti, self.sequence, stage, ip_address))
+
+    def schedule_burst(self, ip_address, tti):
+        gap, self.bursts[ip_address] = self.traffic.arrival(ip_address)
+        self.schedule("UERegistration", tti + gap, ip_address)
+
+    def has_work(self, stage):
+        if stage == "Modulation":
+            return len(read_netbuffer("AirInterface", "UERegister")) > 0
+        if stage == "Profiler":
+            return len(read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets")) > 0
+        if stage == "Sorter":
+            return len(read_netbuffer("MAC", "TransmissionQueue")) > 0
+        if scheduling_mode == "tti" and read_netbuffer("Scheduler", "ResourceGrid").backlogged():
+            return True
+        return read_netbuffer("Scheduler", "SortedPackets").ready_sessions() > 0 or len(read_netbuffer("Scheduler", "Backlog")) > 0
+
+    def fire(self, stage, ip_address=None):
+        if stage == "UERegistration":
+            response = register_UE_session(ip_address, self.bursts[ip_address], self.traffic)
+            self.schedule_burst(ip_address, self.clock.tti)
+            return response
+        if stage == "Modulation":
+            return modulate_packets()
+        if stage == "Profiler":
+            return profile_packets()
+        if stage == "Sorter":
+            return sort_packets()
+        return schedule_packets()
+
+    def run(self, duration):
+        # simulate duration ms of network traffic and return a summary of the run
+        global network_clock, netlog_enabled
+        started = datetime.datetime.today()
+        previous_clock, previous_logging = network_clock, netlog_enabled
+        network_clock, netlog_enabled = self.clock, self.logging
+        try:
+            end = self.clock.tti + duration
+            for ip_address in self.UEs:
+                if ip_address not in self.bursts:
+                    self.schedule_burst(ip_address, self.clock.tti)
+            for stage in self.stages[1:]:
+                if self.has_work(stage):
+                    self.schedule(stage, self.clock.tti)
+            while self.events and self.events[0][0] < end:
+                tti, sequence, stage, ip_address = heappop(self.events)
+                del self.pending[(stage, ip_address)]
+                self.clock.advance(tti - self.clock.tti)
+                if self.next_reset and tti >= self.next_reset:
+                    reset_network()
+                    self.next_reset += self.reset_interval
+                self.fire(stage, ip_address)
+                self.event_counts[stage] += 1
+                # re-arm this stage and wake the idle stages it produces work for
+                for name in [stage] + self.wakes[stage]:
+                    if name != "UERegistration" and (name, None) not in self.pending and self.has_work(name):
+                        self.schedule(name, tti + self.intervals[name])
+            self.clock.advance(end - self.clock.tti)
+        finally:
+            network_clock, netlog_enabled = previous_clock, previous_logging
+        return {
+            "simulated_ms" : duration,
+            "virtual_time" : str(self.clock.now()),
+            "events" : self.event_counts,
+            "runtime_secs" : (datetime.datetime.today() - started).total_seconds(),
+            "Transmission" : dict(TransmissionQoS.size)
+        }
+
+#-------------- Parameter Sweeps --------------
+
+sweep_parameters = ["BER_baseline", "retransmission_limit", "packet_duplication", "min_IP_packet_size", "max_IP_packet_size", "scheduling_mode"]
+
+def expand_grid(grid):
+    # cartesian product of the value lists of a grid, as parameter dicts
+    names = [name for name in sweep_parameters if name in grid]
+    return [dict(zip(names, values)) for values in product(*[grid[name] for name in names])]
+
+def burst_profile(profile):
+    # NetworkSimulator settings for a UE burst profile, e.g.
+    # { "name" : "busy", "UEs" : 20, "burst_size" : 10, "burst_interval" : 500, "arrival" : "poisson" }
+    settings = { key : profile[key] for key in profile if key != "name" }
+    if isinstance(settings.get("UEs"), int):
+        settings["UEs"] = ["10.0.%s.%s" % (i // 250, i % 250 + 1) for i in range(settings["UEs"])]
+    return settings
+
+def simulate_run(run):
+    # one independent simulation, executed in a sweep worker process
+    global scheduler_events
+    for name in run["parameters"]:
+        globals()[name] = run["parameters"][name]
+    seed(run["seed"])
+    scheduler_events = 0
+    reset_network()
+    NetworkSimulator(seed=run["seed"], **burst_profile(run["profile"])).run(run["duration"])
+    rows = []
+    for scheduler in Transmission:
+        row = { "run" : run["run"], "seed" : run["seed"], "profile" : run["profile"].get("name", ""), "scheduler" : scheduler }
+        row.update(run["parameters"])
+        row.update(TransmissionQoS.summary(scheduler))
+        rows.append(row)
+    return rows
+
+def run_sweep(grid, duration=60000, repetitions=1, base_seed=0, workers=None):
+    '''
+        Monte-Carlo sweep of the network model. Every combination of the parameter lists and
+        UE burst profiles in the grid is simulated repetitions times, each run with its own
+        seed, across a pool of worker processes (one per core by default). Returns one row of
+        QoS results per run and scheduler.
+    '''
+    defaults = { name : globals()[name] for name in sweep_parameters }
+    profiles = grid.get("profiles", [{ "name" : "default" }])
+    runs = []
+    for point in expand_grid(grid):
+        for profile in profiles:
+            for repetition in range(repetitions):
+                runs.append({
+                    "run" : len(runs),
+                    "seed" : base_seed + len(runs),
+                    "duration" : duration,
+                    "parameters" : dict(defaults, **point),
+                    "profile" : profile
+                })
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = executor.map(simulate_run, runs, chunksize=1)
+        return [row for rows in results for row in rows]
+
+def write_table(rows, path):
+    with open(path, "w", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+#-------------- Snapshots --------------
+
+cell_id = None # the cell served by this process when it is a cluster worker
+
+def cell_snapshot_path():
+    return snapshot_path if cell_id is None else "%s.cell-%s" % (snapshot_path, cell_id)
+
+# the globals a snapshot may name: the model's own records and structures, and the NumPy state they hold
+snapshot_classes = ["IPPacket", "MACPacket", "TrafficGenerator", "NetQueue", "RingLog", "SessionTable", "ResourceGrid", "QoSAggregator", "CQIQueue", "SchedulerBacklog"]
+snapshot_globals = [
+    ("collections", "deque"), ("numpy", "dtype"), ("numpy", "ndarray"),
+    ("numpy.core.multiarray", "_reconstruct"), ("numpy._core.multiarray", "_reconstruct"),
+    ("numpy.core.numeric", "_frombuffer"), ("numpy._core.numeric", "_frombuffer"),
+    ("numpy.random._pickle", "__generator_ctor"), ("numpy.random._pickle", "__bit_generator_ctor"),
+    ("numpy.random._pcg64", "PCG64"), ("numpy.random.bit_generator", "SeedSequence"), ("numpy.random.bit_generator", "__pyx_unpickle_SeedSequence")
+]
+
+class SnapshotUnpickler(pickle.Unpickler):
+    '''
+        Reads network snapshots: only the allow-listed globals can be loaded, and the model's
+        own classes resolve to this module whatever name it was run or imported under
+    '''
+    def find_class(self, module, name):
+        if name in snapshot_classes:
+            return globals()[name]
+        if (module, name) in snapshot_globals:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError("%s.%s is not allowed in a network snapshot" % (module, name))
+
+def network_state():
+    # everything needed to resume the network: netbuffers (with the NetLog), QoS aggregates and traffic streams
+    return {
+        "NETWORK_DATA" : NETWORK_DATA,
+        "Transmission" : { scheduler : { "locked" : view["locked"], "packets" : list(view["packets"]) } for scheduler, view in Transmission.items() },
+        "TransmissionQoS" : TransmissionQoS,
+        "scheduler_events" : scheduler_events,
+        "UETraffic" : UETraffic,
+        "saved" : str(now())
+    }
+
+def snapshot_network():
+    # writes the network state to the snapshot file while requests carry on; the file is replaced atomically
+    started = datetime.datetime.today()
+    path = cell_snapshot_path()
+    # every writer (endpoint or checkpoint thread) gets its own temporary file next to the snapshot
+    descriptor, temp_path = mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(descriptor, "wb") as handle:
+            pickle.dump(network_state(), handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    duration_ms = 1000*(datetime.datetime.today() - started).total_seconds()
+    return "%s: %s" % (200, "Network state saved to %s (%s bytes in %sms)" % (path, os.path.getsize(path), round(duration_ms, 3)))
+
+def restore_network():
+    # replaces the network state with the snapshot file, read through a memory map
+    global Transmission, TransmissionQoS, scheduler_events, UETraffic
+    path = cell_snapshot_path()
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return "%s: %s" % (404, "No network state found at %s" % path)
+    try:
+        with open(path, "rb") as handle:
+            with mmap(handle.fileno(), 0, access=ACCESS_READ) as mapped:
+                state = SnapshotUnpickler(mapped).load()
+    except Exception as e:
+        print("Error @ restore_network : %s" % str(e))
+        return "%s: %s" % (400, "Network state at %s could not be read" % path)
+    for netbuffer_host_dir in state["NETWORK_DATA"]:
+        NETWORK_DATA[netbuffer_host_dir] = state["NETWORK_DATA"][netbuffer_host_dir]
+    Transmission = state["Transmission"]
+    TransmissionQoS = state["TransmissionQoS"]
+    with scheduler_lock:
+        scheduler_events = state["scheduler_events"]
+    UETraffic = state["UETraffic"]
+    # restored versions may be behind the ones already published
+    for netbuffer_host_dir in NETWORK_DATA:
+        for netbuffer in NETWORK_DATA[netbuffer_host_dir].values():
+            if isinstance(netbuffer, SharedState):
+                netbuffer.touch()
+    TransmissionQoS.touch()
+    return "%s: %s" % (200, "Network state saved at %s restored from %s" % (state["saved"], path))
+
+def checkpoint_network(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            snapshot_network()
+        except Exception as e:
+            print("Error @ checkpoint : %s" % str(e))
+
+def start_checkpoints():
+    # background checkpoints of the network state every checkpoint_interval seconds
+    if checkpoint_interval:
+        threading.Thread(target=checkpoint_network, args=(checkpoint_interval,), daemon=True).start()
+
+#-------------- Multi-cell Cluster --------------
+
+cluster = None # the CellCluster served by this process, if any
+
+network_epoch = Id() # changes on every start, so versions published by an earlier process are not trusted
+
+# the network data structures published by the Inspect API, built on demand per section
+inspect_sections = {
+    "UERegister" : lambda: read_netbuffer("AirInterface", "UERegister").to_list(),
+    "QueuedMACPackets" : lambda: read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets").to_list(),
+    "TransmissionQueue" : lambda: read_netbuffer("MAC", "TransmissionQueue").to_list(),
+    "RejectedPackets" : lambda: read_netbuffer("MAC", "RejectedPackets").to_list(),
+    "SortedPackets" : lambda: read_netbuffer("Scheduler", "SortedPackets").to_dict(),
+    "Backlog" : lambda: read_netbuffer("Scheduler", "Backlog").to_dict(),
+    "Transmission" : lambda: transmission_view(),
+    "Pending" : lambda: len(read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets")),
+    "Rejected" : lambda: [packet.sessionId for packet in read_netbuffer("MAC", "RejectedPackets").to_list()],
+    "NetQueues" : lambda: {
+        "UERegister" : read_netbuffer("AirInterface", "UERegister").stats(),
+        "QueuedMACPackets" : read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets").stats(),
+        "TransmissionQueue" : read_netbuffer("MAC", "TransmissionQueue").stats()
+    }
+}
+
+def inspect_versions():
+    # the epoch of this network and the version of each Inspect section (the last change of the netbuffers it shows)
+    UERegister = read_netbuffer("AirInterface", "UERegister").version
+    QueuedMACPackets = read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets").version
+    TransmissionQueue = read_netbuffer("MAC", "TransmissionQueue").version
+    RejectedPackets = read_netbuffer("MAC", "RejectedPackets").version
+    return network_epoch, {
+        "UERegister" : UERegister,
+        "QueuedMACPackets" : QueuedMACPackets,
+        "TransmissionQueue" : TransmissionQueue,
+        "RejectedPackets" : RejectedPackets,
+        "SortedPackets" : read_netbuffer("Scheduler", "SortedPackets").version,
+        "Backlog" : read_netbuffer("Scheduler", "Backlog").version,
+        "Transmission" : TransmissionQoS.version,
+        "Pending" : QueuedMACPackets,
+        "Rejected" : RejectedPackets,
+        "NetQueues" : max(UERegister, QueuedMACPackets, TransmissionQueue)
+    }
+
+def project(value, exclude):
+    # copy of an Inspect section with the excluded packet fields (e.g. payload_bits) left out
+    if isinstance(value, PacketRecord):
+        return value.to_dict(exclude)
+    if isinstance(value, dict):
+        return { key : project(item, exclude) for key, item in value.items() }
+    if isinstance(value, (list, deque)):
+        return [project(item, exclude) for item in value]
+    return value
+
+def inspect_payload(sections=None, exclude=[]):
+    # the requested Inspect sections (all by default)
+    payload = { name : inspect_sections[name]() for name in (sections if sections is not None else inspect_sections) }
+    return project(payload, exclude) if exclude else payload
+
+def merge_inspections(payloads):
+    # combines the Inspect payloads of all cells: queues are joined and counters added up,
+    # while the sessions locked by each scheduler are listed per cell
+    merged = payloads[0]
+    if "Transmission" in merged:
+        locked = { scheduler : [payload["Transmission"][scheduler]["locked"] for payload in payloads] for scheduler in merged["Transmission"] }
+    for payload in payloads[1:]:
+        for name in ["UERegister", "QueuedMACPackets", "TransmissionQueue", "RejectedPackets", "Rejected", "Pending"]:
+            if name in merged:
+                merged[name] += payload[name]
+        if "SortedPackets" in merged:
+            merged["SortedPackets"].update(payload["SortedPackets"])
+        for scheduler, sessions in payload.get("Backlog", {}).items():
+            merged["Backlog"][scheduler].update(sessions)
+        for scheduler, view in payload.get("Transmission", {}).items():
+            for key in ["packets", "data", "size"]:
+                merged["Transmission"][scheduler][key] += view[key]
+        for queue, stats in payload.get("NetQueues", {}).items():
+            for key in ["length", "enqueued", "dequeued", "dropped", "refused"]:
+                merged["NetQueues"][queue][key] += stats[key]
+    if "Transmission" in merged:
+        for scheduler in merged["Transmission"]:
+            merged["Transmission"][scheduler]["locked"] = locked[scheduler]
+    return merged
+
+def changed_sections(sections, cells, since):
+    # sections changed in any cell after the since token ("<epoch>-<version>" per cell, joined by ".")
+    marks = since.split(".")
+    if len(marks) != len(cells):
+        raise ValueError("expected a version for each of the %s cells" % len(cells))
+    changed = []
+    for name in sections:
+        for (epoch, versions), mark in zip(cells, marks):
+            mark_epoch, mark_version = mark.rsplit("-", 1)
+            # a token from another epoch predates this network: everything counts as changed
+            if mark_epoch != epoch or versions[name] > int(mark_version):
+                changed.append(name)
+                break
+    return changed
+
+def netlog_entries(direction, cursors, limit, events):
+    # a page of this cell's NetLog after ("since") or before its own cursor in cursors
+    Log = read_netbuffer("NetLog", "log")
+    cursor = cursors[cell_id or 0]
+    return Log.since(cursor, limit, events) if direction == "since" else Log.before(cursor, limit, events)
+
+def serve_cell(cellId, connection):
+    # worker process of one cell: runs the calls received on the connection against the cell's own network
+    global cluster, cell_id, Metrics
+    cluster, cell_id, Metrics = None, cellId, StageMetrics()
+    reset_network()
+    if restore_on_start:
+        restore_network()
+    start_checkpoints()
+    while True:
+        call = connection.recv()
+        if call is None:
+            break
+        function, args = call
+        try:
+            result = cell_functions[function](*args)
+        except Exception as e:
+            print("Error @ cell %s : %s" % (cellId, str(e)))
+            result = (500, str(e))
+        connection.send(result)
+    connection.close()
+
+class CellCluster:
+    '''
+        N independent cells, each served by its own worker process with its own netbuffers,
+        Transmission and NetLog, so the cells run on separate cores. UEs are routed to cells
+        by a consistent hash of their IP address: each cell owns cell_replicas points on a
+        hash ring, and a UE belongs to the cell owning the next point after its hash.
+    '''
+    def __init__(self, n_cells, replicas=cell_replicas):
+        self.cells = []
+        self.ring = []
+        for cellId in range(n_cells):
+            connection, worker_connection = Pipe()
+            worker = Process(target=serve_cell, args=(cellId, worker_connection), daemon=True)
+            worker.start()
+            self.cells.append({ "worker" : worker, "connection" : connection, "lock" : threading.Lock() })
+            self.ring += [(key_hash("cell-%s-%s" % (cellId, replica)), cellId) for replica in range(replicas)]
+        self.ring.sort()
+        self.points = [point for point, cellId in self.ring]
+
+    def route(self, ip_address):
+        # the cell serving a UE
+        return self.ring[bisect(self.points, key_hash(ip_address)) % len(self.ring)][1]
+
+    def call(self, cellId, function, *args):
+        cell = self.cells[cellId]
+        with cell["lock"]:
+            cell["connection"].send((function, args))
+            return cell["connection"].recv()
+
+    def broadcast(self, function, *args):
+        # runs a call on all cells in parallel and returns the results in cell order
+        for cell in self.cells:
+            cell["lock"].acquire()
+        try:
+            for cell in self.cells:
+                cell["connection"].send((function, args))
+            return [cell["connection"].recv() for cell in self.cells]
+        finally:
+            for cell in self.cells:
+                cell["lock"].release()
+
+    def close(self):
+        for cell in self.cells:
+            with cell["lock"]:
+                cell["connection"].send(None)
+            cell["worker"].join()
+
+cell_functions = { function.__name__ : function for function in [
+    register_UE_session, modulate_packets, profile_packets, sort_packets, schedule_packets, reset_network,
+    modulate_batch, profile_batch, sort_batch, inspect_payload, inspect_versions, snapshot_network, restore_network, network_metrics,
+    netlog_entries
+]}
+
+def cell_failed(result):
+    # a cell that raised answers (500, message) instead of its result
+    return isinstance(result, tuple) and len(result) == 2 and result[0] == 500 and isinstance(result[1], str)
+
+def cell_stage(stage, *args):
+    # runs a network stage here, or on every cell when serving a cluster (one response line per cell)
+    if cluster:
+        responses = ["%s: %s" % response if cell_failed(response) else response for response in cluster.broadcast(stage.__name__, *args)]
+        return "\n".join(["[cell %s] %s" % (cellId, response) for cellId, response in enumerate(responses)])
+    return stage(*args)
+
+def cell_batch(batch, n_items):
+    # runs a batch drain here, or on every cell when serving a cluster
+    if cluster:
+        results = cluster.broadcast(batch.__name__, n_items)
+        codes = [code for code, summary in results]
+        summaries = [{ "drained" : 0, "error" : result[1] } if cell_failed(result) else result[1] for result in results]
+        return (200 if 200 in codes else codes[0]), { "drained" : sum([summary["drained"] for summary in summaries]), "cells" : summaries }
+    return batch(n_items)
+
+def netlog_cursor(value):
+    # NetLog cursors hold one sequence number per cell, joined by "." when serving a cluster
+    n_cells = len(cluster.cells) if cluster else 1
+    if not value:
+        return [0]*n_cells
+    cursors = [int(mark) for mark in value.split(".")]
+    if len(cursors) != n_cells:
+        raise ValueError("expected a sequence number for each of the %s cells" % n_cells)
+    return cursors
+
+def read_netlog(direction, cursors, limit, events):
+    # a page of (cellId, entry) pairs and the cursors after it; the cells' pages are merged by time,
+    # oldest first after the cursors ("since") or newest first before them
+    if cluster:
+        pages = cluster.broadcast("netlog_entries", direction, cursors, limit, events)
+        for cellId, page in enumerate(pages):
+            if cell_failed(page):
+                print("Error @ netlog : cell %s: %s" % (cellId, page[1]))
+        entries = [(cellId, entry) for cellId, page in enumerate(pages) if not cell_failed(page) for entry in page]
+        entries = sorted(entries, key=lambda item: (item[1][1], item[0], item[1][0]), reverse=direction != "since")[:limit]
+    else:
+        entries = [(0, entry) for entry in netlog_entries(direction, cursors, limit, events)]
+    cursors = list(cursors)
+    for cellId, entry in entries:
+        cursors[cellId] = entry[0]
+    return entries, cursors
+
+def cursor_mark(cursors):
+    return ".".join([str(cursor) for cursor in cursors])
+
+#-------------- Network Endpoints --------------
+
+# inspect data structures: ?exclude=payload_bits,source_bits leaves packet fields out, ?since=<version> returns
+# only the sections changed after a version; polls with If-None-Match get a 304 while the sections are unchanged
+@app.route("/SubNetworkLTE/Internal/Inspect/<path:section>")
+def InspectData(section):
+    if section != "all" and section not in inspect_sections:
+        return responsify(404, "Unknown section: %s" % section)
+    sections = list(inspect_sections) if section == "all" else [section]
+    exclude = request.args.get("exclude")
+    exclude = exclude.split(",") if exclude else []
+    since = request.args.get("since")
+    cells = cluster.broadcast("inspect_versions") if cluster else [inspect_versions()]
+    version = ".".join(["%s-%s" % (epoch, max([versions[name] for name in sections])) for epoch, versions in cells])
+    etag = Id("%s|%s|%s|%s" % (section, ",".join(exclude), since, version))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        if since is not None:
+            try:
+                sections = changed_sections(sections, cells, since)
+            except ValueError as e:
+                return responsify(400, "Invalid version: %s" % str(e))
+        if sections:
+            payload = merge_inspections(cluster.broadcast("inspect_payload", sections, exclude)) if cluster else inspect_payload(sections, exclude)
+        else:
+            payload = {}
+        if since is not None:
+            response = responsify(200, "%s changed sections attached" % len(payload), { "version" : version, "changes" : payload })
+        else:
+            response = responsify(200, "%s data attached" % section, payload if section == "all" else payload[section])
+    response.set_etag(etag)
+    response.headers["X-Network-Version"] = version
+    return response
+
+# stage metrics in the Prometheus text format (per cell when serving a cluster)
+@app.route("/metrics")
+def ExportMetrics():
+    if cluster:
+        families = {}
+        for cellId, cell_families in enumerate(cluster.broadcast("network_metrics")):
+            for name, kind, description, samples in cell_families:
+                family = families.setdefault(name, (name, kind, description, []))
+                family[3].extend([(suffix, dict(labels, cell=cellId), value) for suffix, labels, value in samples])
+        return Response(render_metrics(families.values()), mimetype="text/plain; version=0.0.4")
+    return Response(render_metrics(network_metrics()), mimetype="text/plain; version=0.0.4")
+
+# Reset
+@app.route("/SubNetworkLTE/Reset")
+def Reset():
+    return str(cell_stage(reset_network))
+
+# save and restore the network state
+@app.route("/SubNetworkLTE/Internal/Snapshot")
+def SnapshotNetwork():
+    return cell_stage(snapshot_network)
+
+@app.route("/SubNetworkLTE/Internal/Restore")
+def RestoreNetwork():
+    return cell_stage(restore_network)
+
+# schedule packets
+@app.route("/SubNetworkLTE/Scheduler/Schedule")
+def SchedulePackets():
+    return cell_stage(schedule_packets)
+
+def netlog_filters():
+    # event type filter and page size from the query string, e.g. ?events=REJECTED_PACKET,QUEUED_PACKET&limit=50
+    events = request.args.get("events")
+    return (events.split(",") if events else None), request.args.get("limit", netlog_page_size, type=int)
+
 # simulation agent firing mechanism for returning activity logs
 @app.route("/SubNetworkLTE/NetLog")
 def ShowActivity():
-    Log = read_netbuffer("NetLog", "log")
-    if Log:
-        html = '<html><meta http-equiv="refresh" content="5"><body bgcolor="black"><div style="color: white; font-family: consolas; font-size:12;">%s</div></body></html>'
-        spool = ""; count = -1
-        for log in Log[::-1]:
-            count+=1
-            spool += '<p><b>%s --> </b>[%s] <span style="color: %s;">[%s]</span> [%s]' % log + ' (#%s)</p>' % str(len(Log) - count)
+    events, limit = netlog_filters()
+    try:
+        cursor = netlog_cursor(request.args.get("before"))
+    except ValueError as e:
+        return responsify(400, "Invalid cursor: %s" % str(e))
+    entries, older_cursor = read_netlog("before", cursor, limit, events)
+    if entries:
+        # only the newest page refreshes itself
+        refresh = '' if any(cursor) else '<meta http-equiv="refresh" content="5">'
+        html = '<html>' + refresh + '<body bgcolor="black"><div style="color: white; font-family: consolas; font-size:12;">%s</div></body></html>'
+        spool = ""
+        for cellId, entry in entries:
+            mark = ('cell %s #%s' % (cellId, entry[0])) if cluster else '#%s' % entry[0]
+            spool += '<p><b>%s --> </b>[%s] <span style="color: %s;">[%s]</span> [%s]' % entry[1:] + ' (%s)</p>' % mark
+        older = "?before=%s&limit=%s" % (cursor_mark(older_cursor), limit)
+        if events:
+            older += "&events=%s" % ",".join(events)
+        spool += '<p><a style="color: cyan;" href="%s">older events</a></p>' % older
         return html % spool
     else:
         return "%s: %s" % (404, "No activity logs found")
 
+# paginated activity logs: entries after the ?after cursor, oldest first
+# (when serving a cluster the cells' logs are merged and cursors hold a sequence number per cell, e.g. 12.7.30)
+@app.route("/SubNetworkLTE/NetLog/Entries")
+def ActivityEntries():
+    events, limit = netlog_filters()
+    try:
+        cursor = netlog_cursor(request.args.get("after"))
+    except ValueError as e:
+        return responsify(400, "Invalid cursor: %s" % str(e))
+    entries, cursor = read_netlog("since", cursor, limit, events)
+    entries = [log_entry(entry, cellId if cluster else None) for cellId, entry in entries]
+    return responsify(200, "%s log entries attached" % len(entries), { "cursor" : cursor_mark(cursor) if cluster else cursor[0], "entries" : entries })
+
+# live activity logs as Server-Sent Events, resuming after the ?after cursor or the Last-Event-ID header
+@app.route("/SubNetworkLTE/NetLog/Stream")
+def StreamActivity():
+    events, limit = netlog_filters()
+    cursor = None
+    if request.headers.get("Last-Event-ID"):
+        try:
+            cursor = netlog_cursor(request.headers["Last-Event-ID"])
+        except ValueError:
+            pass  # ?after is used when the header is absent or invalid
+    if cursor is None:
+        try:
+            cursor = netlog_cursor(request.args.get("after"))
+        except ValueError as e:
+            return responsify(400, "Invalid cursor: %s" % str(e))
+    def stream(cursor):
+        while True:
+            entries, _ = read_netlog("since", cursor, limit, events)
+            for cellId, entry in entries:
+                # every event id is the cursor just after it, so a reconnect resumes from there
+                cursor[cellId] = entry[0]
+                yield "id: %s\ndata: %s\n\n" % (cursor_mark(cursor), json.dumps(log_entry(entry, cellId if cluster else None)))
+            if not entries:
+                yield ": idle\n\n"
+                time.sleep(1)
+    return Response(stream(cursor), mimetype="text/event-stream", headers={"Cache-Control" : "no-cache"})
+
 # simulation agent firing mechanism for sorting verified packets
 @app.route("/SubNetworkLTE/Scheduler/Sorter")
 def SortPackets():
-    try:
-        TransmissionQueue = read_netbuffer("MAC", "TransmissionQueue")
-        packet = TransmissionQueue.pop()  # release a MAC packet
-        # add scheduler start
-        packet["header"].append(now())
-        write_netbuffer("MAC", "TransmissionQueue", TransmissionQueue)
-        sessionId = packet["sessionId"]
-        SortedPackets = read_netbuffer("Scheduler", "SortedPackets")
-        if SortedPackets:
-            if sessionId in SortedPackets:
-                SortedPackets[sessionId]["packets"].insert(0, packet)
-            else:
-                SortedPackets[sessionId] = { "busy" : False, "packets" : [packet] }
-        else:
-            SortedPackets = {sessionId: { "busy" : False, "packets" : [packet] }}
-        write_netbuffer("Scheduler", "SortedPackets", SortedPackets)
-        log(sessionId, "SORTED_PACKET", "1 packet with id: %s was sorted (%s bits)" % (packet["header"][5], packet["header"][8]))
-        return "%s: %s" % (201, "Packet was sorted (%s bits)" % packet["header"][8])
-    except Exception as e:
-        print("Error @ sorter : %s" % str(e))
-        return "%s: %s" % (404, "No packet found")
+    return cell_stage(sort_packets)
 
 # simulation agent firing mechanism for validating packet integrity
 @app.route("/SubNetworkLTE/MAC/Profiler")
 def ProfilePackets():
-    def retransmit(packet):
-        # check if retransmission_limit reached
-        if packet["header"][4] + 1 > retransmission_limit:
-            # reject this MAC packet
-            RejectedPackets = read_netbuffer("MAC", "RejectedPackets")
-            if RejectedPackets:
-                RejectedPackets.append(packet)
-            else:
-                RejectedPackets = [packet]
-            write_netbuffer("MAC", "RejectedPackets", RejectedPackets)
-            log(packet["sessionId"], "REJECTED_PACKET", "1 packet with id: %s was rejected (%s bits)" % (packet["header"][5], packet["header"][8]))
-            return "%s: %s" % (204, "Packet was rejected (%s bits)" % packet["header"][8])
-        else:
-            packet["header"][4]+=1
-            retransmitted_session = MAC2IPSession(packet) # convert MAC packet back to IP session
-            UERegister = read_netbuffer("AirInterface", "UERegister")
-            if UERegister:
-                UERegister.append(retransmitted_session)  # lower priority for unvalidated retransmitted packets
-            else:
-                UERegister = [retransmitted_session]
-            write_netbuffer("AirInterface", "UERegister", UERegister) # retransmit IP session
-            log(packet["sessionId"], "RETRANSMITTED_PACKET", "1 packet with id: %s was retransmitted (%s bits)" % (packet["header"][5], packet["header"][8]))
-            return "%s: %s" % (200, "Packet was retransmitted (%s bits)" % packet["header"][8])
-    def queue(packet):
-        TransmissionQueue = read_netbuffer("MAC", "TransmissionQueue")
-        if TransmissionQueue:
-            TransmissionQueue.insert(0, packet)  # FIFO
-        else:
-            TransmissionQueue = [packet]
-        write_netbuffer("MAC", "TransmissionQueue", TransmissionQueue) # queue this transmittable MAC packet
-        log(packet["sessionId"], "QUEUED_PACKET", "1 packet with id: %s was queued (%s bits)" % (packet["header"][5], packet["header"][8]))
-        return "%s: %s" % (201, "Packet was queued (%s bits)" % packet["header"][8])
-    try:
-        QueuedMACPackets = read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets")
-        packet = QueuedMACPackets.pop() # release a MAC packet
-        write_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets", QueuedMACPackets)
-        # test MAC packet for errors, handle contextually
-        if Id(packet["payload_bits"], True) == packet["header"][3]:
-            return queue(packet)
-        else:
-            return retransmit(packet)
-    except Exception as e:
-        print("Error @ profiler : %s" % str(e))
-        return "%s: %s" % (404, "No packet found")
+    return cell_stage(profile_packets)
 
 # simulation agent firing mechanism for transcoding IP packets to MAC packets
 @app.route("/SubNetworkLTE/PhysicalUplinkControlChannel/Modulation")
 def ModulatePackets():
-    session = None
-    UERegister = read_netbuffer("AirInterface", "UERegister")
-    if UERegister:
-        session = UERegister.pop()
-        write_netbuffer("AirInterface", "UERegister", UERegister)
-        ip_address, session_time, sessionId, n_packets, ip_packets_loggable = session
-        ip_packets = [log for log in ip_packets_loggable]
-        # Packet Modulation
-        delay = ms_elapsed(session_time); modulated = 0
-        for packet in ip_packets:
-            delay+=packet["header"][3]  # add retransmission delay
-            mod_started = now()
-            MAC_packets = []
-            packetId = Id()
-            field = transcode_bits(packet["payload_bits"], transcoding_plan(packet["header"][0], MAC_packet_size))
-            packet_index = -1
-            for band in field:
-                packet_index+=1
-                source_bits, trans_bits = band
-                mod_delay = ms_elapsed(mod_started); delay+=mod_delay # add modulation delay
-                # FIFO Queue, preserve retransmissions
-                MAC_packets.insert(0, MAC_Packet(sessionId, trans_bits, ip_address, delay, Id(source_bits, True), packet["header"][4], packetId, packet_index, len(field), len(trans_bits)))
-            modulated+=len(MAC_packets)
-            QueuedMACPackets = read_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets")
-            if QueuedMACPackets:
-                QueuedMACPackets = MAC_packets + QueuedMACPackets # ensure FIFO
-            else:
-                QueuedMACPackets = MAC_packets
-            write_netbuffer("PhysicalUplinkControlChannel", "QueuedMACPackets", QueuedMACPackets)
-            log(sessionId, "MAC_PACKETS_MODULATED", "%s MAC packets from session %s delayed %sms" % (len(MAC_packets), sessionId, mod_delay))
-        return "%s: %s" % (200, "Successfully modulated %s packets" % modulated)
-    else:
-        return "%s: %s" % (404, "No session found")
+    return cell_stage(modulate_packets)
+
+def run_batch(batch, n_items, drained):
+    # <n_items> is a number of queued items, or "all" to drain everything currently queued
+    try:
+        n_items = None if n_items == "all" else int(n_items)
+    except ValueError:
+        return responsify(400, "Batch size must be a number or 'all'")
+    if n_items is not None and n_items < 0:
+        return responsify(400, "Batch size must not be negative")
+    code, summary = cell_batch(batch, n_items)
+    return responsify(code, drained % summary["drained"], summary)
+
+# batch firing mechanisms: drain up to <n_items> queued items in one call
+@app.route("/SubNetworkLTE/PhysicalUplinkControlChannel/Modulation/Batch/<n_items>")
+def ModulateBatch(n_items):
+    return run_batch(modulate_batch, n_items, "%s sessions modulated")
+
+@app.route("/SubNetworkLTE/MAC/Profiler/Batch/<n_items>")
+def ProfileBatch(n_items):
+    return run_batch(profile_batch, n_items, "%s packets profiled")
+
+@app.route("/SubNetworkLTE/Scheduler/Sorter/Batch/<n_items>")
+def SortBatch(n_items):
+    return run_batch(sort_batch, n_items, "%s packets sorted")
 
 # simulation agent firing mechanism for authenticating UE sessions and receiving IP packets
 @app.route("/SubNetworkLTE/AirInterface/UERegistration/<path:n_packets>")
 def UERegistration(n_packets):
-    ip_address = request.remote_addr
-    try:
-        session = UESession(ip_address, int(n_packets))
-    except Exception as e:
-        print("Error @ create_session : %s" % str(e))
-        return "%s: %s" % (400, "Error creating session: packet_size not specified")
-    UERegister = read_netbuffer("AirInterface", "UERegister")
-    if UERegister:
-        UERegister.insert(0, session)  #FIFO Queue
-    else:
-        UERegister = [session]
-    write_netbuffer("AirInterface", "UERegister", UERegister)
-    log(session[2], "IP_PACKETS_RECEIVED", 'UE at <span style="color: cyan;">%s</span> sent %s IP packets of %s bits' % (ip_address, n_packets, sum([this_packet["header"][0] for this_packet in session[4]])))
-    return "%s: %s" % (200, "Successfully registered %s packets" % n_packets)
+    if cluster:
+        return cluster.call(cluster.route(request.remote_addr), "register_UE_session", request.remote_addr, n_packets)
+    return register_UE_session(request.remote_addr, n_packets)
 
 if __name__ == "__main__":
-    app.run(host=server_host, port=server_port, threaded=True)
+    if len(sys.argv) > 2 and sys.argv[1] == "simulate":
+        # headless run: python LTE-Network-Model.py simulate <duration_ms>
+        print(json.dumps(NetworkSimulator().run(int(sys.argv[2])), indent=4))
+    elif len(sys.argv) > 3 and sys.argv[1] == "sweep":
+        # parameter sweep: python LTE-Network-Model.py sweep <grid.json> <results.csv>
+        with open(sys.argv[2]) as handle:
+            grid = json.load(handle)
+        rows = run_sweep(grid, grid.get("duration", 60000), grid.get("repetitions", 1), grid.get("seed", 0), grid.get("workers"))
+        write_table(rows, sys.argv[3])
+        print("%s runs written to %s" % (len(rows) // len(Transmission), sys.argv[3]))
+    else:
+        # multi-cell server: python LTE-Network-Model.py cells <n_cells>
+        if len(sys.argv) > 2 and sys.argv[1] == "cells":
+            n_cells = int(sys.argv[2])
+        if n_cells > 1:
+            cluster = CellCluster(n_cells)
+        else:
+            if restore_on_start:
+                print(restore_network())
+            start_checkpoints()
+        app.run(host=server_host, port=server_port, threaded=True)
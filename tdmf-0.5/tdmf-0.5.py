@@ -5,8 +5,18 @@
 #
 # Version: 0.5
 
+import asyncio
+import ast
+import inspect
 import datetime
+import hashlib
+import json
+import threading
+import itertools
+import multiprocessing
 import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 global flags, testEngine, tdmf_templates
 
@@ -40,8 +50,9 @@ looper_workflow.run() # remove this sample workflow when you're sure everything
 # This section is for your project components (functions and classes). Components should be atomic
 # and do exactly one thing. Write your tests in the Pipelines section and use flags to manage mutable
 # state and message passing between your components. Components must always receive an array package
-# and return an array.
+# and return an array. I/O-bound components can be "async def" coroutines.
 
+@component
 def sample_component(package):
     """
         A sample component
@@ -78,6 +89,13 @@ sample_pipeline = Pipeline([
     "times_two"
 ])
 
+sample_pipeline2 = Pipeline([
+    ("times_two", "sample_pipeline")  # a pipeline can take its input from the output of another
+])
+
+components.add("sample_pipeline", sample_pipeline)  # register pipelines that workflows or other pipelines refer to by name
+components.add("sample_pipeline2", sample_pipeline2)
+
 sample_pipeline.build()  # build and run your pipeline
 
 ''',
@@ -96,6 +114,8 @@ sample_workflow = Workflow([
     ], "sample_pipeline2")
 ])
 
+components.add("sample_workflow", sample_workflow)  # register workflows that other workflows refer to by name
+
 looper_workflow = Workflow([
     "sample_workflow" for i in range(10)
 ])
@@ -125,6 +145,104 @@ class MutableState:
 
 flags = MutableState()
 
+class ComponentRegister:
+    '''
+        Explicit register of the components, pipelines and workflows that pipelines and
+        workflows refer to by name. Names not registered here are looked up in the
+        framework namespace.
+    '''
+    def __init__(self):
+        self.register = {}
+        self.version = 0
+
+    def add(self, name, obj):
+        self.register[name] = obj
+        self.version += 1
+        return obj
+
+    def remove(self, name):
+        if name in self.register:
+            self.register.pop(name)
+            self.version += 1
+
+    def lookup(self, name):
+        if name in self.register:
+            return self.register[name]
+        namespace = globals()
+        if name in namespace:
+            return namespace[name]
+        raise LookupError("unregistered component: {}".format(name))
+
+components = ComponentRegister()
+
+def component(function):
+    # decorator: register a component under its own name
+    return components.add(function.__name__, function)
+
+def compile_expression(expr):
+    # compile a string expression (e.g. a context switch) once, for evaluation at run time
+    try:
+        return compile(expr, "<tdmf>", "eval")
+    except SyntaxError:
+        return None
+
+def compile_input(package):
+    # the pipeline input as a callable: literal data, the output of another pipeline,
+    # or an inline expression such as fetch_flag_inline('key')
+    if not isinstance(package, str):
+        return lambda: package
+    try:
+        source = components.lookup(package)
+        return lambda: getattr(source, "output", package)
+    except LookupError:
+        pass
+    code = compile_expression(package)
+    if code is None:
+        return lambda: package
+    def evaluate():
+        try:
+            return eval(code, globals()).output
+        except:
+            return package
+    return evaluate
+
+def loop_running():
+    # whether this thread is already running an event loop, where asyncio.run cannot be used
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+def call_component(component, package):
+    # call a component from synchronous code; async components run to completion
+    # on an event loop of their own
+    output = component(package)
+    if inspect.iscoroutine(output):
+        if loop_running():
+            output.close()
+            raise RuntimeError("async component called inside a running event loop, use build_async")
+        output = asyncio.run(output)
+    return output
+
+async def await_component(component, package):
+    # call a component from a running event loop, awaiting it if it is async
+    output = component(package)
+    if inspect.isawaitable(output):
+        output = await output
+    return output
+
+def compile_steps(names):
+    # resolve each name once into (name, object, switch); context switch expressions
+    # are kept as compiled code since they route on flags at run time
+    steps = []
+    for name in names:
+        if "context_switch(" in name:
+            steps.append((name, None, compile_expression(name)))
+        else:
+            steps.append((name, components.lookup(name), None))
+    return steps
+
 class fetch_flag_inline:
     def __init__(self, item):
         self.item = item
@@ -138,6 +256,32 @@ def elapsed_secs(t):
     # get the total seconds elapsed since time t
     return (now() - t).total_seconds()
 
+def code_digest(code, digest):
+    # feed a code object, and the code objects nested in its constants, into a hash
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            code_digest(const, digest)
+        else:
+            digest.update(repr(const).encode())
+
+def default_cache_path():
+    # the test cache lives next to this module, or under the user's cache directory when
+    # the module's directory is not writable (e.g. an installed package)
+    here = os.path.dirname(os.path.abspath(__file__))
+    if os.access(here, os.W_OK):
+        return os.path.join(here, "tdmf-test-cache.json")
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "tdmf", "tdmf-test-cache.json")
+
+def read_cache(path):
+    try:
+        with open(path) as handle:
+            cache = json.load(handle)
+    except:
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
 def pt_string_only(package):
     # package test: check only string items in package
     return sum([isinstance(item, str) for item in package]) == len(package)
@@ -160,6 +304,7 @@ class TestRegister:
     '''
     def __init__(self):
         self.register = {}
+        self.register_version = 0
         self.last_register_status = -1
 
     def add_test(self, test_category, function, test_name, test_package=None, test_output=None):
@@ -176,6 +321,7 @@ class TestRegister:
             else:
                 self.register[function] = {}
                 self.register[function][test_category] = [obj]
+            self.register_version += 1
             self.last_register_status = 1
         else:
             self.last_register_status = 0
@@ -188,6 +334,7 @@ class TestRegister:
                 if found:
                     index = found[0]
                     self.register[function][test_category].pop(index)
+                    self.register_version += 1
                     self.last_register_status = 1
 
     def lookup_tests(self, function):
@@ -204,7 +351,60 @@ class TestModule(TestRegister):
         super().__init__()
         self.test_status = {}
         self.last_test_output = None
-        self.options = { "verbose" : True  }
+        self.options = { "verbose" : True, "cache" : True, "cache_path" : default_cache_path() }
+        self.cache = None
+        self.cache_keys = {}
+        self.cache_lock = threading.Lock()
+
+    def test_key(self, function, component, package_tests, unit_tests):
+        # content address of a function's unit test outcomes: its bytecode, its registered
+        # test cases and package test names (None when the component has no bytecode)
+        memo = self.cache_keys.get(function)
+        if memo and memo[0] is component and memo[1] == self.register_version:
+            return memo[2]
+        code = getattr(component, "__code__", None)
+        key = None
+        if code is not None:
+            digest = hashlib.sha1()
+            code_digest(code, digest)
+            digest.update(repr(getattr(component, "__defaults__", None)).encode())
+            digest.update(repr(unit_tests).encode())
+            digest.update(repr(package_tests).encode())
+            key = digest.hexdigest()
+        self.cache_keys[function] = (component, self.register_version, key)
+        return key
+
+    def cached_tests(self, function, key):
+        with self.cache_lock:
+            return self.cached_entry(function, key)
+
+    def cached_entry(self, function, key):
+        if self.cache is None:
+            self.cache = read_cache(self.options["cache_path"])
+        entry = self.cache.get(function)
+        if isinstance(entry, dict) and entry.get("key") == key:
+            return entry
+        return None
+
+    def cache_tests(self, function, key, entry):
+        # one entry per function, so changed code or tests replace the stale outcome; the file
+        # is re-read and merged, so entries written by other processes are kept, then written
+        # whole and swapped in, so readers in other processes never see a partial one
+        entry["key"] = key
+        with self.cache_lock:
+            path = self.options["cache_path"]
+            self.cache = dict(self.cache or {}, **read_cache(path))
+            self.cache[function] = entry
+            temp = "{}.{}.tmp".format(path, os.getpid())
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                with open(temp, "w") as handle:
+                    json.dump(self.cache, handle)
+                os.replace(temp, path)
+            except Exception as error:
+                if os.path.exists(temp):
+                    os.remove(temp)
+                print("TestCacheError: could not write the test cache: {}".format(str(error)))
 
     def report(self, function):
         template = '''
@@ -222,6 +422,7 @@ class TestModule(TestRegister):
         PASSED: {} tests
         FAILED: {} tests: {}
         NOT_FOUND: {} tests: {}
+        cached: {}
         duration: {} secs.
 
         '''
@@ -234,18 +435,35 @@ class TestModule(TestRegister):
                     len(self.test_status[function]["unit"]["passed"]), \
                     len(self.test_status[function]["unit"]["failed"]), self.test_status[function]["unit"]["failed"],\
                     len(self.test_status[function]["unit"]["not_found"]), self.test_status[function]["unit"]["not_found"],\
+                    self.test_status[function]["unit"]["cached"],\
                     self.test_status[function]["unit"]["runtime"]
                 )
             )
 
-    def run_tests(self, function, package):
-        self.test_status[function] = {
-            "package" : {
-                "passed" : [],
-                "failed" : [],
-                "not_found" : [],
-                "runtime" : 0
-            },
+    def run_package_tests(self, function, package):
+        section = {
+            "passed" : [],
+            "failed" : [],
+            "not_found" : [],
+            "runtime" : 0
+        }
+        started = now()
+        for test in self.lookup_tests(function).get("package", []):
+            test = "pt_{}".format(test)
+            try:
+                passed = components.lookup(test)(package)
+                if passed:
+                    section["passed"].append(test)
+                else:
+                    section["failed"].append(test)
+            except:
+                section["not_found"].append(test)
+        section["runtime"] = elapsed_secs(started)
+        return section
+
+    def run_tests(self, function, package, component=None):
+        status = {
+            "package" : self.run_package_tests(function, package),
             "unit" : {
                 "passed" : [],
                 "failed" : [],
@@ -264,39 +482,45 @@ class TestModule(TestRegister):
         except:
             unit_tests = []
 
-        # run package tests
-        started = now()
-        for test in package_tests:
-            test = "pt_{}".format(test)
+        if component is None:
             try:
-                passed = eval(test)(package)
-                if passed:
-                    self.test_status[function]["package"]["passed"].append(test)
-                else:
-                    self.test_status[function]["package"]["failed"].append(test)
-            except:
-                self.test_status[function]["package"]["not_found"].append(test)
-        self.test_status[function]["package"]["runtime"] = elapsed_secs(started)
+                component = components.lookup(function)
+            except LookupError:
+                pass
 
-        # run unit tests
+        # run unit tests, or reuse their outcome if neither the component nor its tests changed
         started = now()
-        for test, test_package, test_output in unit_tests:
-            try:
-                if test_output == eval(function)(test_package):
-                    self.test_status[function]["unit"]["passed"].append(test)
-                    self.last_test_output = test_output
-                else:
-                    self.test_status[function]["unit"]["failed"].append(test)
-            except:
-                self.test_status[function]["unit"]["failed"].append(test)
-        self.test_status[function]["unit"]["runtime"] = elapsed_secs(started)
+        key = self.test_key(function, component, package_tests, unit_tests) if self.options["cache"] else None
+        cached = self.cached_tests(function, key) if key else None
+        if cached:
+            status["unit"]["passed"] = list(cached["passed"])
+            status["unit"]["failed"] = list(cached["failed"])
+        else:
+            for test, test_package, test_output in unit_tests:
+                try:
+                    if test_output == call_component(component, test_package):
+                        status["unit"]["passed"].append(test)
+                        self.last_test_output = test_output
+                    else:
+                        status["unit"]["failed"].append(test)
+                except:
+                    status["unit"]["failed"].append(test)
+            if key:
+                self.cache_tests(function, key, {
+                    "passed" : list(status["unit"]["passed"]),
+                    "failed" : list(status["unit"]["failed"])
+                })
+        status["unit"]["cached"] = bool(cached)
+        status["unit"]["runtime"] = elapsed_secs(started)
 
         # check test approval and report
-        total = self.test_status[function]["unit"]["passed"] + self.test_status[function]["package"]["passed"] + \
-        self.test_status[function]["unit"]["not_found"] + self.test_status[function]["package"]["not_found"]
+        total = status["unit"]["passed"] + status["package"]["passed"] + \
+        status["unit"]["not_found"] + status["package"]["not_found"]
         if len(total) == len(package_tests + unit_tests):
-            self.test_status[function]["approved"] = True
+            status["approved"] = True
+        self.test_status[function] = status
         self.report(function)
+        return status
 
 testEngine = TestModule()
 
@@ -306,86 +530,466 @@ class Pipeline:
         Group related functions sequentially by piping the output of a preceding function
         to the input of the current function
     '''
-    def __init__(self, process):
+    def __init__(self, process, reads=None, writes=None):
         self.process = process
+        self.reads = reads or []    # flags read and written by the components, declared so that
+        self.writes = writes or []  # dag workflows can tell which pipelines may run concurrently
         self.executed = False
         self.started = None
         self.output = None
         self.can_run = False
-        self.options = { "debug" : False, "run_tests" : True }
+        self.plan = None
+        self.options = { "debug" : False, "run_tests" : True, "max_in_flight" : 64 } # max_in_flight: default async stream concurrency
+    def __getstate__(self):
+        # the plan holds closures; a pipeline sent to a pool process compiles its own
+        state = dict(self.__dict__)
+        state["plan"] = None
+        return state
     def set_options(self, changeset = { }):
         common = [ key for key in self.options.keys() if key in changeset ]
         for key in common:
             self.options[key] = changeset[key]
-    def build(self):
-        self.started = now()
-        try:
-            primer, curr_package = self.process[0]
+    def compile(self):
+        # resolve the input and components once into an execution plan of direct callables
+        primer, package = self.process[0]
+        self.plan = {
+            "input" : compile_input(package),
+            "steps" : compile_steps([primer] + list(self.process[1:])),
+            "version" : components.version
+        }
+        self.plan["async"] = any([inspect.iscoroutinefunction(component) for name, component, switch in self.plan["steps"]])
+        return self.plan
+    def resources(self):
+        # what a workflow step reads and writes: the pipeline it takes input from and its
+        # declared flags are read; the pipeline itself and its declared flags are written
+        reads = { ("flag", key) for key in self.reads }
+        writes = { ("flag", key) for key in self.writes } | { ("object", id(self)) }
+        package = self.process[0][1]
+        if isinstance(package, str):
             try:
-                curr_package = eval(curr_package).output
-            except:
+                reads.add(("object", id(components.lookup(package))))
+            except LookupError:
                 pass
-            functions = [primer] + self.process[1:]
-            failed = False
-            for function in functions:
-                if "context_switch(" in function:
-                    function = eval(function)
-                if self.options["run_tests"]:
-                    testEngine.run_tests(function, curr_package)
-                    if testEngine.test_status[function]["approved"]:
-                        curr_package = testEngine.last_test_output
-                    else:
-                        failed = True
-                        print("BuildError: pipeline build failed at function: {}. Duration: {} secs.".format(function, elapsed_secs(self.started)))
-                        break
-                else:
-                    curr_package = eval(function)(curr_package)
-            if not failed:
-                self.output = curr_package
-                self.executed = True
-                self.can_run = False
-                print("Pipeline executed successfully (check trace for function-specific errors). Duration: {} secs.".format(elapsed_secs(self.started)))
-            else:
-                print("Pipeline failed at step {} of {} [function: {}]. Duration: {} secs.".format(index, len(self.process), function, elapsed_secs(self.started)))
+        return reads, writes
+    def build(self, package=None):
+        # package, if given, replaces the pipeline's own input
+        self.started = now()
+        self.executed = False
+        try:
+            if not self.plan or self.plan["version"] != components.version:
+                self.compile()
+            if self.plan["async"] and loop_running():
+                print("BuildError: pipeline has async components and an event loop is already running; await build_async() instead. Duration: {} secs.".format(elapsed_secs(self.started)))
+                return
+            curr_package = self.plan["input"]() if package is None else package
+            self.built(*self.run_package(curr_package, {}))
+        except Exception as err:
+            if self.options["debug"]:
+                print(str(err))
+            print("BuildError: pipeline not properly constructed. Duration: {} secs.".format(elapsed_secs(self.started)))
+    async def build_async(self, package=None):
+        # build on the running event loop, awaiting async components
+        self.started = now()
+        self.executed = False
+        try:
+            if not self.plan or self.plan["version"] != components.version:
+                self.compile()
+            curr_package = self.plan["input"]() if package is None else package
+            self.built(*(await self.run_package_async(curr_package, {})))
         except Exception as err:
             if self.options["debug"]:
                 print(str(err))
             print("BuildError: pipeline not properly constructed. Duration: {} secs.".format(elapsed_secs(self.started)))
+    def built(self, output, failure):
+        if not failure:
+            self.output = output
+            self.executed = True
+            self.can_run = False
+            print("Pipeline executed successfully (check trace for function-specific errors). Duration: {} secs.".format(elapsed_secs(self.started)))
+        else:
+            index, function = failure
+            print("BuildError: pipeline build failed at function: {}. Duration: {} secs.".format(function, elapsed_secs(self.started)))
+            print("Pipeline failed at step {} of {} [function: {}]. Duration: {} secs.".format(index+1, len(self.process), function, elapsed_secs(self.started)))
+
+    def passes_tests(self, function, component, package, approved):
+        # unit tests gate each function the first time a build or stream reaches it; their
+        # verdict is a future in approved, which packages reaching the function during that
+        # first run wait on. Package tests judge every package on its own
+        verdict = Future()
+        first = approved.setdefault(function, verdict)
+        if first is verdict:
+            return self.first_tests(function, component, package, verdict)
+        return first.result() and not testEngine.run_package_tests(function, package)["failed"]
+    def first_tests(self, function, component, package, verdict):
+        try:
+            status = testEngine.run_tests(function, package, component)
+        except BaseException as err:
+            verdict.set_exception(err)
+            raise
+        verdict.set_result(not status["unit"]["failed"])
+        return status["approved"]
+    def run_package(self, package, approved):
+        # one package through the plan: (output, None), or (None, (step, function)) if a
+        # function failed its tests
+        for index, (function, component, switch) in enumerate(self.plan["steps"]):
+            if switch:
+                function = eval(switch, globals())
+                component = components.lookup(function)
+            if self.options["run_tests"] and not self.passes_tests(function, component, package, approved):
+                return None, (index, function)
+            package = call_component(component, package)
+        return package, None
+    async def run_package_async(self, package, approved):
+        # as run_package, on the running event loop; a function's first tests run on a
+        # worker thread since they call the component synchronously, and the packages
+        # reaching the function meanwhile await their verdict
+        loop = asyncio.get_running_loop()
+        for index, (function, component, switch) in enumerate(self.plan["steps"]):
+            if switch:
+                function = eval(switch, globals())
+                component = components.lookup(function)
+            if self.options["run_tests"]:
+                verdict = Future()
+                first = approved.setdefault(function, verdict)
+                if first is verdict:
+                    passed = await loop.run_in_executor(None, self.first_tests, function, component, package, verdict)
+                else:
+                    passed = await asyncio.wrap_future(first) and not testEngine.run_package_tests(function, package)["failed"]
+                if not passed:
+                    return None, (index, function)
+            package = await await_component(component, package)
+        return package, None
+    def run_batch(self, start, batch, approved):
+        outputs = []
+        for index, package in enumerate(batch, start):
+            output, failure = self.run_package(package, approved)
+            if failure:
+                print("StreamError: package {} failed tests at function: {}".format(index, failure[1]))
+            else:
+                outputs.append(output)
+        return outputs
+    async def run_batch_async(self, start, batch, approved):
+        # the packages of a batch run concurrently; outputs keep their order
+        outputs = []
+        results = await asyncio.gather(*[self.run_package_async(package, approved) for package in batch])
+        for index, (output, failure) in enumerate(results, start):
+            if failure:
+                print("StreamError: package {} failed tests at function: {}".format(index, failure[1]))
+            else:
+                outputs.append(output)
+        return outputs
+    def stream(self, packages, batch_size=None, max_in_flight=None, workers=None):
+        # run the pipeline over an iterable of packages instead of its own input, lazily,
+        # yielding each output in order (or a list per batch of batch_size packages).
+        # With workers, batches run on a thread pool with at most max_in_flight packages
+        # (default 2 batches per worker) submitted but not yet yielded; packages that fail
+        # their tests are reported and skipped. Pipelines with async components otherwise
+        # run on an event loop with up to max_in_flight packages (default options["max_in_flight"],
+        # and at least one batch) in flight at once.
+        self.started = now()
+        self.executed = False
+        if not self.plan or self.plan["version"] != components.version:
+            self.compile()
+        approved = {}
+        size = batch_size or 1
+        batches = package_batches(packages, size)
+        if workers:
+            results = self.pooled_batches(batches, approved, workers, max(1, (max_in_flight or 2*size*workers) // size))
+        elif self.plan["async"]:
+            if loop_running():
+                raise RuntimeError("async pipeline streamed inside a running event loop, use build_async per package or pass workers")
+            results = self.looped_batches(batches, approved, max(1, (max_in_flight or self.options["max_in_flight"]) // size))
+        else:
+            results = (self.run_batch(start, batch, approved) for start, batch in batches)
+        for outputs in results:
+            if outputs:
+                self.output = outputs[-1]
+            if batch_size:
+                if outputs:
+                    yield outputs
+            else:
+                yield from outputs
+        self.executed = True
+        print("Pipeline stream finished. Duration: {} secs.".format(elapsed_secs(self.started)))
+    def pooled_batches(self, batches, approved, workers, limit):
+        executor = ThreadPoolExecutor(max_workers=workers)
+        in_flight = deque()
+        try:
+            for start, batch in batches:
+                in_flight.append(executor.submit(self.run_batch, start, batch, approved))
+                if len(in_flight) >= limit:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+    def looped_batches(self, batches, approved, limit):
+        # batches run as tasks on a private event loop, which runs while the oldest is awaited
+        loop = asyncio.new_event_loop()
+        in_flight = deque()
+        try:
+            for start, batch in batches:
+                in_flight.append(loop.create_task(self.run_batch_async(start, batch, approved)))
+                if len(in_flight) >= limit:
+                    yield loop.run_until_complete(in_flight.popleft())
+            while in_flight:
+                yield loop.run_until_complete(in_flight.popleft())
+        finally:
+            for task in in_flight:
+                task.cancel()
+            if in_flight:
+                loop.run_until_complete(asyncio.gather(*in_flight, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+def build_remote(pipeline, package, state):
+    # build a pipeline in a pool process from its input and the flags it reads, and
+    # send back its output and the flags it writes
+    flags.state.update(state)
+    pipeline.build(package)
+    return pipeline.executed, pipeline.output, { key : flags.get(key) for key in pipeline.writes }
+
+def package_batches(packages, size):
+    # (index of the first package, [package, ...]) for consecutive runs of size packages
+    packages = iter(packages)
+    start = 0
+    while True:
+        batch = list(itertools.islice(packages, size))
+        if not batch:
+            return
+        yield start, batch
+        start += len(batch)
 
 class Workflow:
     '''
-        Sequential pipeline execution model. Also supports workflow piping.
+        Sequential pipeline execution model. Also supports workflow piping. In "dag" mode,
+        pipelines that do not depend on each other run concurrently on a thread or process pool,
+        or as tasks on an event loop with the "asyncio" backend.
     '''
     def __init__(self, pipelines):
         self.pipelines = pipelines
         self.output = None
+        self.outputs = []
         self.executed = False
         self.started = None
+        self.plan = None
+        self.options = { "mode" : "sequential", "backend" : "thread", "workers" : None }
+    def set_options(self, changeset = { }):
+        common = [ key for key in self.options.keys() if key in changeset ]
+        for key in common:
+            self.options[key] = changeset[key]
+    def compile(self):
+        # resolve pipeline and workflow names once
+        self.plan = { "steps" : compile_steps(self.pipelines), "version" : components.version }
+        return self.plan
+    def resources(self):
+        if not self.plan or self.plan["version"] != components.version:
+            self.compile()
+        reads, writes = set(), { ("object", id(self)) }
+        for name, pipeline, switch in self.plan["steps"]:
+            step_reads, step_writes = step_resources(pipeline, switch)
+            reads |= step_reads
+            writes |= step_writes
+        return reads, writes
     def build(self):
         self.run()
     def run(self):
         if self.pipelines:
-            self.started = now()
-            n_executed = 0
-            no_errors = True
-            curr_pipeline = None
-            index = -1
-            while n_executed < len(self.pipelines) and no_errors:
-                index += 1
-                curr_pipeline = eval(self.pipelines[index])
-                curr_pipeline.build()
-                if curr_pipeline.executed:
-                    n_executed += 1
-                else:
-                    no_errors = False
-            if no_errors:
-                print("Workflow executed successfully in {} secs.".format(elapsed_secs(self.started)))
-                self.output = curr_pipeline.output
-                self.executed = True
+            self.start()
+            if self.options["mode"] == "dag" and self.options["backend"] == "asyncio":
+                failed = asyncio.run(self.run_dag_async())
+            elif self.options["mode"] == "dag":
+                failed = self.run_dag()
             else:
-                print("Workflow halted due to failed pipeline: {} ({} of {}). Duration: {} secs.".format(self.pipelines[index], index+1, len(self.pipelines), elapsed_secs(self.started)))
+                failed = self.run_sequential()
+            self.finish(failed)
         else:
             pass
+    async def build_async(self):
+        await self.run_async()
+    async def run_async(self):
+        # run on the running event loop, awaiting async components in place
+        if self.pipelines:
+            self.start()
+            if self.options["mode"] == "dag":
+                failed = await self.run_dag_async()
+            else:
+                failed = await self.run_sequential_async()
+            self.finish(failed)
+    def start(self):
+        self.started = now()
+        self.executed = False
+        if not self.plan or self.plan["version"] != components.version:
+            self.compile()
+    def finish(self, failed):
+        if failed is None:
+            print("Workflow executed successfully in {} secs.".format(elapsed_secs(self.started)))
+            self.output = self.outputs[-1]
+            self.executed = True
+        else:
+            print("Workflow halted due to failed pipeline: {} ({} of {}). Duration: {} secs.".format(self.pipelines[failed], failed+1, len(self.pipelines), elapsed_secs(self.started)))
+    def run_sequential(self):
+        # returns the index of the failed pipeline, if any
+        self.outputs = []
+        for index, (name, curr_pipeline, switch) in enumerate(self.plan["steps"]):
+            if switch:
+                curr_pipeline = components.lookup(eval(switch, globals()))
+            curr_pipeline.build()
+            if not curr_pipeline.executed:
+                return index
+            self.outputs.append(curr_pipeline.output)
+        return None
+    async def run_sequential_async(self):
+        self.outputs = []
+        for index in range(len(self.plan["steps"])):
+            curr_pipeline = await self.run_step_async(index)
+            if not curr_pipeline.executed:
+                return index
+            self.outputs.append(curr_pipeline.output)
+        return None
+    def dependencies(self):
+        # step index -> indices of earlier steps it must wait for: a step waits for the last
+        # writer of anything it reads or writes, and for the readers of anything it writes
+        # since that was last written. Context switches wait for, and block, everything.
+        last_writer, readers, waiting_on = {}, {}, []
+        for index, (name, pipeline, switch) in enumerate(self.plan["steps"]):
+            reads, writes = step_resources(pipeline, switch)
+            reads = reads | { "context_switch" }
+            waits = set()
+            for resource in reads | writes:
+                if resource in last_writer:
+                    waits.add(last_writer[resource])
+            for resource in writes:
+                waits |= readers.pop(resource, set())
+                last_writer[resource] = index
+            for resource in reads - writes:
+                readers.setdefault(resource, set()).add(index)
+            waits.discard(index)
+            waiting_on.append(waits)
+        return waiting_on
+    def run_step(self, index):
+        # build one step in this process and return its pipeline or workflow
+        name, pipeline, switch = self.plan["steps"][index]
+        if switch:
+            pipeline = components.lookup(eval(switch, globals()))
+        pipeline.build()
+        return pipeline
+    async def run_step_async(self, index):
+        # build one step on the running event loop; pipelines and workflows are awaited,
+        # anything else that can be built runs on a worker thread
+        name, pipeline, switch = self.plan["steps"][index]
+        if switch:
+            pipeline = components.lookup(eval(switch, globals()))
+        if isinstance(pipeline, (Pipeline, Workflow)):
+            await pipeline.build_async()
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, pipeline.build)
+        return pipeline
+    async def run_dag_async(self):
+        # as run_dag, with steps as tasks on the running event loop and at most "workers"
+        # of them building at once
+        steps = self.plan["steps"]
+        waiting_on = self.dependencies()
+        dependents = [[] for step in steps]
+        for index, waits in enumerate(waiting_on):
+            for earlier in waits:
+                dependents[earlier].append(index)
+        ready = [index for index, waits in enumerate(waiting_on) if not waits]
+        outputs = [None for step in steps]
+        failed = []
+        running = {}
+        while running or (ready and not failed):
+            while ready and not failed and len(running) < (self.options["workers"] or len(steps)):
+                index = ready.pop(0)
+                running[asyncio.ensure_future(self.run_step_async(index))] = index
+            done, pending = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda task: running[task]):
+                index = running.pop(task)
+                try:
+                    pipeline = task.result()
+                    executed = pipeline.executed
+                    outputs[index] = pipeline.output
+                except Exception as error:
+                    print("WorkflowError: step {} ({}) raised: {}".format(index+1, steps[index][0], str(error)))
+                    executed = False
+                if not executed:
+                    failed.append(index)
+                    continue
+                for later in dependents[index]:
+                    waiting_on[later].discard(index)
+                    if not waiting_on[later]:
+                        ready.append(later)
+            ready.sort()
+        self.outputs = outputs
+        return min(failed) if failed else None
+    def run_dag(self):
+        # run every step once the steps it depends on have executed, with outputs kept in
+        # workflow order; returns the index of the first failed pipeline, if any
+        steps = self.plan["steps"]
+        waiting_on = self.dependencies()
+        dependents = [[] for step in steps]
+        for index, waits in enumerate(waiting_on):
+            for earlier in waits:
+                dependents[earlier].append(index)
+        ready = [index for index, waits in enumerate(waiting_on) if not waits]
+        outputs = [None for step in steps]
+        failed = []
+        local = ThreadPoolExecutor(max_workers=self.options["workers"])
+        remote = None
+        if self.options["backend"] == "process":
+            start_methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in start_methods else None)
+            remote = ProcessPoolExecutor(max_workers=self.options["workers"], mp_context=context)
+        running, sent = {}, set()
+        try:
+            while running or (ready and not failed):
+                while ready and not failed:
+                    index = ready.pop(0)
+                    name, pipeline, switch = steps[index]
+                    if remote and not switch and isinstance(pipeline, Pipeline):
+                        if not pipeline.plan or pipeline.plan["version"] != components.version:
+                            pipeline.compile()
+                        state = { key : flags.get(key) for key in pipeline.reads }
+                        running[remote.submit(build_remote, pipeline, pipeline.plan["input"](), state)] = index
+                        sent.add(index)
+                    else:
+                        running[local.submit(self.run_step, index)] = index
+                done, pending = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda future: running[future]):
+                    index = running.pop(future)
+                    try:
+                        if index in sent:
+                            pipeline = steps[index][1]
+                            pipeline.executed, pipeline.output, written = future.result()
+                            for key in written:
+                                flags.set(key, written[key])
+                        else:
+                            pipeline = future.result()
+                        executed = pipeline.executed
+                        outputs[index] = pipeline.output
+                    except Exception as error:
+                        print("WorkflowError: step {} ({}) raised: {}".format(index+1, steps[index][0], str(error)))
+                        executed = False
+                    if not executed:
+                        failed.append(index)
+                        continue
+                    for later in dependents[index]:
+                        waiting_on[later].discard(index)
+                        if not waiting_on[later]:
+                            ready.append(later)
+                ready.sort()
+        finally:
+            local.shutdown()
+            if remote:
+                remote.shutdown()
+        self.outputs = outputs
+        return min(failed) if failed else None
+
+def step_resources(pipeline, switch):
+    # context switches route on flags at run time, so they conflict with every step
+    if switch:
+        return { "context_switch" }, { "context_switch" }
+    return pipeline.resources()
 
 def context_switch(conditionals, default):
     '''
@@ -408,6 +1012,30 @@ def context_switch(conditionals, default):
     else:
         return default
 
+def template_names(node):
+    # names a template step list refers to: its strings, pipeline origins and context switch targets
+    if isinstance(node, ast.Constant):
+        return { node.value } if isinstance(node.value, str) else set()
+    if isinstance(node, ast.Call):
+        if getattr(node.func, "id", None) == "context_switch":
+            return set().union(*[template_names(arg) for arg in node.args])
+        return set()
+    return set().union(*[template_names(child) for child in ast.iter_child_nodes(node)])
+
+def check_templates():
+    # names the pipelines and workflows of the project templates refer to that neither the
+    # templates nor the framework register (a generated project could not resolve them)
+    registered, referred = set(components.register), set()
+    for template in tdmf_templates[1:]:
+        for node in ast.walk(ast.parse(template)):
+            if isinstance(node, ast.FunctionDef) and "component" in [getattr(decorator, "id", None) for decorator in node.decorator_list]:
+                registered.add(node.name)
+            elif isinstance(node, ast.Call) and getattr(node.func, "attr", None) == "add" and getattr(node.func.value, "id", None) == "components":
+                registered.add(node.args[0].value)
+            elif isinstance(node, ast.Call) and getattr(node.func, "id", None) in ["Pipeline", "Workflow"]:
+                referred |= template_names(node.args[0])
+    return sorted(referred - registered)
+
 def CreateTDMFApp():
     '''
         Create TDMF Projects quicker with this interactive prompt
@@ -431,6 +1059,10 @@ def CreateTDMFApp():
                     proceed = 1
                 else:
                     proceed = 0
+        unresolved = check_templates()
+        if unresolved:
+            print("CreateAppError: the project templates refer to unregistered names - {}".format(", ".join(unresolved)))
+            proceed = 0
         if proceed == 0:
             print("exiting.")
         else:
@@ -482,6 +1114,7 @@ testEngine.add_test("unit", "times_two", ("test1", [1,2,3], [2,4,6]))  # array i
 
 flags.set("times_two_output", [])
 
+@component
 def sample_function(package):
     global flags
     '''
@@ -497,6 +1130,7 @@ def sample_function(package):
         print("error at function: {} --> {}".format(func_name, str(error)))
     return output # [...] - output must always be an array
 
+@component
 def get_sum(package):
     global flags
     '''
@@ -510,6 +1144,7 @@ def get_sum(package):
         print("error at function: {} --> {}".format(func_name, str(error)))
     return output # [...] - output must always be an array
 
+@component
 def times_two(package):
     global flags
     '''
@@ -524,7 +1159,7 @@ def times_two(package):
         if times_two_output:
             times_two_output += output
         else:
-            times_two_output = output
+            times_two_output = list(output)
         flags.set("times_two_output", times_two_output)
     except Exception as error:
         print("error at function: {} --> {}".format(func_name, str(error)))